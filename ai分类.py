@@ -1,24 +1,303 @@
-from 可视化 import ConsoleOutput
-from openai import OpenAI
+from 可视化 import DEBUG, INFO, ConsoleOutput
+from 记录解析 import parse_line
+from 账目数据 import RecordStore, columns_path, file_signature
+from 账本历史 import LedgerHistory, import_range
+from 本地分类 import LocalClassifier, extract_amount, extract_date
+from 提示构建 import PromptBuilder, estimate_tokens
+from 客户端管理 import get_client_manager
+from 请求调度 import get_request_scheduler, is_retryable
+from 性能指标 import MetricsRecorder
+from 大额消费 import LargeExpenseTracker
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ThreadPoolExecutor, wait
+from collections import Counter
+import datetime
+import hashlib
+import json
 import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# 等待分块结果时检查取消的间隔（秒）
+CANCEL_POLL_INTERVAL = 0.2
+
+def partial_path(output_file):
+    """写入中的临时文件：config.txt.partial"""
+    return output_file + '.partial'
+
+class ClassificationCache:
+    """分类结果的本地缓存（SQLite），超过容量时按最近使用时间淘汰
+
+    只缓存 "TYPE:类别 NAME:名称"，键为去掉日期和金额后的记录文本；
+    命中时日期和金额从原记录中重新解析，不会沿用第一次分类时的日期。
+    """
+
+    # 缓存内容格式变化时修改，旧格式的条目不再命中
+    FORMAT = 2
+
+    def __init__(self, db_path, max_entries=50000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_used ON cache(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def normalize(line):
+        """统一全角/半角、大小写和空白，使同一条记录得到相同的键"""
+        line = unicodedata.normalize('NFKC', line).lower()
+        return ' '.join(line.split())
+
+    @staticmethod
+    def hash_text(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def split_line(line, today):
+        """拆出记录的 (日期, 金额, 其余文本)；日期或金额无法确定时返回 None，这样的记录不使用缓存"""
+        date, rest = extract_date(line, today)
+        if date is None:
+            return None
+        amount, rest = extract_amount(rest)
+        if amount is None:
+            return None
+        return date, amount, rest
+
+    def make_key(self, text, categories_hash, model_name):
+        """缓存键：规范化后的记录文本（不含日期和金额）+ 分类标准哈希 + 模型名"""
+        return self.hash_text(f"{self.FORMAT}\0{model_name}\0{categories_hash}\0{self.normalize(text)}")
+
+    @staticmethod
+    def to_value(line, date, amount):
+        """由 AI 返回的记录行得到缓存内容；与原记录的日期（月、日）或金额不一致时返回 None"""
+        record = parse_line(line)
+        if record is None or abs(record.amount - amount) >= 0.005:
+            return None
+        if (record.date.month, record.date.day) != (date.month, date.day):
+            return None
+        return f"TYPE:{record.category} NAME:{record.name}"
+
+    @staticmethod
+    def from_value(value, date, amount):
+        """用原记录的日期和金额还原完整的记录行"""
+        return f"DATE:{date.isoformat()} {value} COST:{amount:.2f}"
+
+    def get_many(self, keys):
+        """批量查询，返回 {key: result}，命中的条目刷新使用时间"""
+        found = {}
+        with self._lock:
+            now = time.time_ns()
+            for key in keys:
+                row = self._conn.execute("SELECT result FROM cache WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                found[key] = row[0]
+                self._conn.execute("UPDATE cache SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return found
+
+    def put_many(self, items):
+        """批量写入 (key, result)，然后淘汰超出容量的旧条目"""
+        if not items:
+            return
+        with self._lock:
+            now = time.time_ns()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, result, last_used) VALUES (?, ?, ?)",
+                [(key, result, now) for key, result in items]
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class StreamingSink:
+    """流式模式下接收逐条到达的记录：写入控制台、累计分类汇总，并逐行追加到 output_file
+
+    output_file 为临时文件（config.txt.partial），记录按到达顺序写入；运行成功后由 save_to_config
+    按输入顺序整体重写并替换 config.txt，失败或取消时删除，上次的 config.txt 保持不变。
+    设置了 tracker（大额消费.LargeExpenseTracker）时，新到达的大额或异常消费立即提示。
+    """
+    def __init__(self, console, output_file, tracker=None):
+        self.console = console
+        self.tracker = tracker
+        self.totals = {}
+        self.count = 0
+        # 已提示过的大额消费；撤回后重试再次到达时不重复提示
+        self._alerted = Counter()
+        self._suppressed = Counter()
+        self._lock = threading.Lock()
+        self._file = open(output_file, 'w', encoding='utf-8')
+        self._file.write('# start\n')
+        self._file.flush()
+
+    def add(self, lines, show=True):
+        with self._lock:
+            # 取消后仍在进行的请求可能继续送来记录，关闭后直接丢弃
+            if self._file is None:
+                return
+            for line in lines:
+                record = parse_line(line)
+                if record is not None:
+                    self.totals[record.category] = self.totals.get(record.category, 0.0) + record.amount
+                self.count += 1
+                self._file.write(line + '\n')
+                if show:
+                    self.console.log(f"  + {line}")
+                    if record is not None and self.tracker is not None:
+                        self._check_large(record)
+            self._file.flush()
+
+    def _check_large(self, record):
+        expense = self.tracker.add(record.date, record.category, record.name, record.amount)
+        if expense is None:
+            return
+        key = expense[:4]
+        self._alerted[key] += 1
+        if self._suppressed[key] > 0:
+            self._suppressed[key] -= 1
+            return
+        reason = "异常" if expense.score is not None and expense.score >= self.tracker.mad_factor else "大额"
+        self.console.log(f"  ! {reason}消费: {record.category} {record.name} {record.amount:.2f}元")
+
+    def retract(self, lines):
+        """分块失败重试前，撤回该分块已计入汇总和大额跟踪的记录"""
+        with self._lock:
+            for line in lines:
+                record = parse_line(line)
+                if record is not None:
+                    self.totals[record.category] -= record.amount
+                    if self.tracker is not None:
+                        self._retract_large(record)
+                self.count -= 1
+
+    def _retract_large(self, record):
+        key = (record.date, record.category, record.name, record.amount)
+        if self._alerted[key] > 0:
+            self._alerted[key] -= 1
+            self._suppressed[key] += 1
+        self.tracker.remove(*key)
+
+    def summary(self):
+        with self._lock:
+            parts = [f"{category} {total:.2f}元" for category, total in
+                     sorted(self.totals.items(), key=lambda item: item[1], reverse=True)]
+        return f"实时汇总（{self.count} 条）: " + "，".join(parts)
+
+    def close(self):
+        with self._lock:
+            self._file.write('# end\n')
+            self._file.close()
+            self._file = None
 
 class AccountProcessor:
-    def __init__(self, api_key, base_url, model_name, output_widget, output_dir):
+    def __init__(self, api_key, base_url, model_name, output_widget, output_dir,
+                 batch_size=0, max_workers=4, max_retries=2,
+                 use_cache=True, cache_path=None, cache_max_entries=50000,
+                 incremental=False, progress_callback=None, cancel_event=None,
+                 stream=False, use_history=True, use_local_rules=True,
+                 input_token_budget=6000, output_token_budget=4000, compact_output=False,
+                 client_manager=None, fallback_models=(), scheduler=None, metrics=None,
+                 log_level=INFO, render_charts=True, large_expense_thresholds=""):
         self.api_key = api_key
         self.base_url = base_url
         self.model_name = model_name
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
-        self.console = ConsoleOutput(output_widget)
+        # 当前模型持续不可用时依次改用的候选模型
+        self.models = [model_name] + [m for m in fallback_models if m != model_name]
+        # 重试、退避、限速和模型切换由共享的调度器负责
+        self.scheduler = scheduler or get_request_scheduler()
+        # OpenAI 客户端由共享的管理器按 (base_url, api_key) 复用，第一次请求时才创建
+        self.client_manager = client_manager or get_client_manager()
+        self._client = None
+        # 界面只显示 log_level 及以上的日志，逐条明细等全部写入输出目录的 run.log
+        self.console = ConsoleOutput(output_widget, level=log_level,
+                                     log_file=os.path.join(output_dir, "run.log"))
         self.output_dir = output_dir
+        # 各阶段耗时和计数，追加写入输出目录的 metrics.jsonl
+        self.metrics = metrics or MetricsRecorder(os.path.join(output_dir, "metrics.jsonl"))
+        # 分批模式：batch_size 为每批记录条数上限，0 表示只按 token 预算分块
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        # 分类缓存默认放在输出目录；日期和金额不计入缓存键，每月重复的记录（如房租）可直接复用分类和名称
+        self.cache = None
+        if use_cache:
+            self.cache_path = cache_path or os.path.join(output_dir, "classify_cache.db")
+            self.cache = ClassificationCache(self.cache_path, cache_max_entries)
+        # 增量模式：只处理相对上次运行新增或修改的记录
+        self.incremental = incremental
+        self.state_file = os.path.join(output_dir, "processed.json")
+        # 进度回调 progress_callback(阶段, 百分比)；cancel_event 被设置后尽快结束运行
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event
+        # 流式模式：边接收边解析，逐条输出并写入 config.txt
+        self.stream = stream
+        self.stream_sink = None
+        # 历史账本：累积每次运行的结果，用于按月、季度、年查询和环比
+        self.history_path = os.path.join(output_dir, "history.db") if use_history else None
+        # 本地规则分类：能确定的记录不再发送给 AI
+        self.use_local_rules = use_local_rules
+        self.local_classifier = None
+        # token 预算：按预算打包记录并推算 max_tokens；compact_output 使用紧凑输出格式
+        self.input_token_budget = input_token_budget
+        self.output_token_budget = output_token_budget
+        self.compact_output = compact_output
+        self.prompt_builder = None
+        self.usage = {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+        self.record_count = 0
+        # 为 False 时不生成 PNG 图表（界面中用仪表盘查看）
+        self.render_charts = render_charts
+        # 大额消费阈值设置，如 "30, 住房=3000"，格式见 大额消费.parse_thresholds
+        self.large_expense_thresholds = large_expense_thresholds
+        self._usage_lock = threading.Lock()
         
+    @property
+    def client(self):
+        if self._client is not None:
+            return self._client
+        return self.client_manager.get(self.base_url, self.api_key)
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def report_progress(self, stage, percent):
+        """报告阶段进度，阶段为 prompt / api / parse / charts"""
+        if self.progress_callback is not None:
+            self.progress_callback(stage, int(percent))
+
+    def is_cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
     def read_file(self, file_path):
         """读取文件内容"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read().strip()
-        except Exception as e:
-            self.console.log(f"读取文件 {file_path} 失败: {str(e)}")
-            return ""
+        with self.metrics.span('read_file', file=os.path.basename(file_path)) as span:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read().strip()
+            except Exception as e:
+                self.console.log(f"读取文件 {file_path} 失败: {str(e)}")
+                return ""
+            span['chars'] = len(content)
+            return content
     def get_prompt_template(self):
         """返回嵌入的 prompt 模板"""
         return """
@@ -45,13 +324,9 @@ DATE:2024-01-01 TYPE:食物 NAME:午餐 COST:45.00
 ```
 
         """
-    def create_prompt(self, categories_file, content_file):
-        """组合 prompt"""
-        categories = self.read_file(categories_file)
-        content = self.read_file(content_file)
-        prompt_template = self.get_prompt_template()
-
-        prompt = prompt_template.replace(
+    def build_prompt(self, categories, content):
+        """将分类标准和消费记录填入模板"""
+        return self.get_prompt_template().replace(
             "【分类标准】\n",
             "【分类标准】\n" + categories + "\n"
         ).replace(
@@ -59,90 +334,691 @@ DATE:2024-01-01 TYPE:食物 NAME:午餐 COST:45.00
             "【需要转换的消费记录】\n" + content + "\n"
         )
 
-        self.console.log("\n=== 生成的 Prompt ===")
-        self.console.log(prompt)
-        self.console.log("=== Prompt 结束 ===\n")
+    def record_usage(self, usage):
+        """累计并输出接口返回的 token 用量，返回 (输入, 输出) token 数"""
+        if usage is None:
+            return None
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        with self._usage_lock:
+            self.usage['calls'] += 1
+            self.usage['prompt_tokens'] += prompt_tokens
+            self.usage['completion_tokens'] += completion_tokens
+        self.console.log(f"本次调用 token：输入 {prompt_tokens}，输出 {completion_tokens}", DEBUG)
+        return prompt_tokens, completion_tokens
 
-        return prompt
-        
-    def process_accounts(self, prompt):
-        """使用 AI 处理账目"""
-        self.console.log("\n开始处理账目...")
+    def request_completion(self, prompt, max_tokens):
+        """发送单次对话请求，返回 (文本, 实际使用的模型)"""
+        limit = self.client_manager.limit(self.base_url, self.api_key)
+
+        def request(model):
+            with limit:
+                return self.client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.7,
+                    max_tokens=max_tokens
+                )
+
+        with self.metrics.span('request_completion', max_tokens=max_tokens) as span:
+            response, span['model'] = self.scheduler.call(self.base_url, self.models, request, self.console.log)
+            tokens = self.record_usage(getattr(response, 'usage', None))
+            if tokens is not None:
+                span['prompt_tokens'], span['completion_tokens'] = tokens
+        return response.choices[0].message.content, span['model']
+
+    def stream_completion(self, prompt, max_tokens, info=None):
+        """以流式方式请求，逐条产出 # start 与 # end 之间的记录行
+
+        只保留当前未完成的一行，不在内存中拼接完整响应；传入字典 info 时写入实际使用的模型 info['model']。
+        响应中没有 # start 或在 # end 前中断时抛出 ValueError，运行被取消时关闭连接并抛出 CancelledError。
+        整个流读取期间占用一个并发名额。
+        """
+        limit = self.client_manager.limit(self.base_url, self.api_key)
+
+        def request(model):
+            limit.acquire()
+            try:
+                return self.client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.7,
+                    max_tokens=max_tokens,
+                    stream=True
+                )
+            except Exception:
+                limit.release()
+                raise
+
+        stream, model = self.scheduler.call(self.base_url, self.models, request, self.console.log)
+        if info is not None:
+            info['model'] = model
+        buffer = ''
+        started = False
+        finished = False
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=2000
-            )
-            self.console.log("AI 处理完成")
-            return response.choices[0].message.content
-        except Exception as e:
-            self.console.log(f"API调用失败:")
-            self.console.log(f"错误类型: {type(e).__name__}")
-            self.console.log(f"错误信息: {str(e)}")
-            return None
-            
+            for chunk in stream:
+                if self.is_cancelled():
+                    raise CancelledError()
+                # 部分服务在最后一个数据块中返回 token 用量，# end 之后继续读完
+                self.record_usage(getattr(chunk, 'usage', None))
+                if finished or not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                buffer += delta
+                while '\n' in buffer and not finished:
+                    line, buffer = buffer.split('\n', 1)
+                    line = line.strip()
+                    if not started:
+                        started = '# start' in line
+                    elif '# end' in line:
+                        finished = True
+                    elif line:
+                        yield line
+        finally:
+            stream.close()
+            limit.release()
+        if finished or (started and '# end' in buffer):
+            return
+        raise ValueError("流式响应缺少 # start / # end 标记")
+
+    def emit_records(self, lines):
+        """流式模式下把已确定的结果（缓存、增量沿用）直接写入输出"""
+        if self.stream_sink is not None:
+            self.stream_sink.add(lines, show=False)
+
     def extract_formatted_content(self, ai_response):
         """从 AI 响应中提取格式化的内容"""
         if not ai_response:
             return None
 
-        try:
-            start_idx = ai_response.find('# start')
-            end_idx = ai_response.find('# end')
+        with self.metrics.span('extract_formatted_content', chars=len(ai_response)):
+            try:
+                start_idx = ai_response.find('# start')
+                end_idx = ai_response.find('# end')
+
+                if start_idx != -1 and end_idx != -1:
+                    formatted_content = ai_response[start_idx:end_idx + len('# end')]
+                    return formatted_content
+                return None
+            except Exception as e:
+                self.console.log(f"提取内容出错: {str(e)}")
+                return None
+            
+    def extract_records(self, formatted_content):
+        """取出 # start / # end 之间的记录行"""
+        records = []
+        for line in formatted_content.splitlines():
+            line = line.strip()
+            if line and line not in ('# start', '# end'):
+                records.append(line)
+        return records
+
+    def split_records(self, content):
+        """将记账内容拆分为逐条记录，跳过空行、代码块标记和注释"""
+        records = []
+        for line in content.splitlines():
+            line = line.strip()
+            if not line or line.startswith('```') or line.startswith('//'):
+                continue
+            records.append(line)
+        return records
+
+    def classify_chunk(self, categories, chunk):
+        """处理单个分块，返回 (记录行列表, 实际使用的模型)
+
+        无法提取结果（流式响应不完整）或紧凑格式结果无法还原时记录行列表为 None。
+        在线程池中执行，异常交由调用方记录。流式模式下每条记录到达即交给 stream_sink。
+        """
+        builder = self.prompt_builder
+        if builder is None:
+            builder = PromptBuilder(categories, self.build_prompt, self.input_token_budget,
+                                    self.output_token_budget, self.compact_output)
+        with self.metrics.span('build_prompt', records=len(chunk)) as span:
+            prompt = builder.build(chunk)
+            max_tokens = builder.max_tokens_for(chunk)
+            span['estimated_tokens'] = estimate_tokens(prompt)
+            span['max_tokens'] = max_tokens
+        self.console.log(f"Prompt 长度 {len(prompt)} 字符，约 {span['estimated_tokens']} tokens，"
+                         f"max_tokens {max_tokens}", DEBUG)
+        with self.metrics.span('classify_chunk', records=len(chunk), stream=self.stream_sink is not None) as span:
+            if self.stream_sink is not None:
+                lines = []
+                stream = self.stream_completion(prompt, max_tokens, span)
+                try:
+                    for line in stream:
+                        record_line = builder.decode(line)
+                        if record_line is None:
+                            self.console.log(f"无法还原的紧凑格式结果: {line}")
+                            self.stream_sink.retract(lines)
+                            return None, span['model']
+                        lines.append(record_line)
+                        self.stream_sink.add([record_line])
+                except ValueError as e:
+                    self.stream_sink.retract(lines)
+                    self.console.log(str(e))
+                    return None, span.get('model')
+                except Exception:
+                    self.stream_sink.retract(lines)
+                    raise
+                finally:
+                    stream.close()
+                return lines, span['model']
+            response, span['model'] = self.request_completion(prompt, max_tokens)
+            formatted_content = self.extract_formatted_content(response)
+            if formatted_content is None:
+                return None, span['model']
+            lines = []
+            for line in self.extract_records(formatted_content):
+                record_line = builder.decode(line)
+                if record_line is None:
+                    self.console.log(f"无法还原的紧凑格式结果: {line}")
+                    return None, span['model']
+                lines.append(record_line)
+            return lines, span['model']
+
+    def lines_match(self, chunk, lines):
+        """结果与输入条数相同，且能确定日期和金额的记录与对应结果一致"""
+        if len(lines) != len(chunk):
+            return False
+        today = datetime.date.today()
+        for source, line in zip(chunk, lines):
+            parts = ClassificationCache.split_line(source, today)
+            if parts is not None and ClassificationCache.to_value(line, *parts[:2]) is None:
+                return False
+        return True
+
+    def process_chunks(self, categories, chunks, models=None):
+        """并发处理多个分块，返回按 chunks 顺序展开、与每条记录对应的结果（每项为记录行列表）
+
+        传入 models 列表时追加每条结果实际使用的模型。
+        返回条数与输入条数不一致（或逐条的日期、金额对不上）的分块拆成两半重新请求，
+        直到单条记录（单条记录可以对应多行结果，如一行记了两笔）。
+        无法提取结果的分块单独重试，最多 max_retries 次。请求失败的分块不再整块重试：
+        调度器已经重试并切换过模型（AllModelsFailed），或错误本身不可重试；只有读取流式响应时断开等可重试的错误会再试。
+        有分块请求失败时丢弃其余排队的分块。没有完成的记录结果为 None，已完成的结果照常返回，供调用方保存。
+        等待期间每 CANCEL_POLL_INTERVAL 秒检查一次取消，取消后不等待进行中的请求，立即返回。
+        """
+        total = sum(len(chunk) for chunk in chunks)
+        self.console.log(f"\n开始处理账目：共 {total} 条记录，{len(chunks)} 个分块")
+        results = [None] * total
+        record_models = [self.model_name] * total
+        # 待处理的 (第一条记录的下标, 记录行列表, 已重试次数)
+        pending = []
+        offset = 0
+        for chunk in chunks:
+            pending.append((offset, chunk, 0))
+            offset += len(chunk)
+        failed = []
+        abandoned = []
+
+        rounds = 0
+        while pending:
+            if rounds:
+                self.console.log(f"重新处理 {len(pending)} 个分块（第 {rounds} 轮）...")
+            rounds += 1
+            retry = []
+            executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending)))
+            try:
+                futures = {executor.submit(self.classify_chunk, categories, item[1]): item for item in pending}
+                waiting = set(futures)
+                while waiting and not self.is_cancelled() and not abandoned:
+                    finished, waiting = wait(waiting, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        item = start, chunk, attempt = futures[future]
+                        label = f"记录 {start + 1}-{start + len(chunk)}" if len(chunk) > 1 else f"记录 {start + 1}"
+                        try:
+                            lines, model = future.result()
+                        except Exception as e:
+                            self.console.log(f"{label} 调用失败: {type(e).__name__}: {str(e)}")
+                            if not is_retryable(e):
+                                abandoned.append(item)
+                            elif attempt < self.max_retries:
+                                retry.append((start, chunk, attempt + 1))
+                            else:
+                                failed.append(item)
+                            continue
+                        if lines is not None and len(chunk) > 1 and not self.lines_match(chunk, lines):
+                            self.console.log(f"{label} 返回 {len(lines)} 条结果，与输入 {len(chunk)} 条对不上，拆分后重新请求")
+                            if self.stream_sink is not None:
+                                self.stream_sink.retract(lines)
+                            half = len(chunk) // 2
+                            retry += [(start, chunk[:half], 0), (start + half, chunk[half:], 0)]
+                            continue
+                        if not lines:
+                            self.console.log(f"{label} 无法提取格式化内容")
+                            if attempt < self.max_retries:
+                                retry.append((start, chunk, attempt + 1))
+                            else:
+                                failed.append(item)
+                            continue
+                        if len(chunk) == 1:
+                            results[start] = lines
+                        else:
+                            for j, line in enumerate(lines):
+                                results[start + j] = [line]
+                        record_models[start:start + len(chunk)] = [model] * len(chunk)
+                        self.console.log(f"{label} 完成，{len(lines)} 条结果")
+                        done = sum(1 for r in results if r is not None)
+                        self.report_progress('api', done * 100 / total)
+            finally:
+                # 取消或有分块放弃时丢弃排队的分块，也不等待进行中的请求（其结果会被忽略）
+                stopped = self.is_cancelled() or bool(abandoned)
+                executor.shutdown(wait=not stopped, cancel_futures=stopped)
+            if self.is_cancelled():
+                self.console.log("已取消")
+                break
+            if abandoned:
+                self.console.log(f"{'、'.join(f'记录 {s + 1}-{s + len(c)}' for s, c, _ in abandoned)} 请求失败，"
+                                 "不再处理其余分块")
+                break
+            pending = retry
+
+        if failed:
+            self.console.log(f"仍有 {len(failed)} 个分块失败: "
+                             f"{'、'.join(f'记录 {s + 1}-{s + len(c)}' for s, c, _ in sorted(failed))}")
+        unfinished = results.count(None)
+        if unfinished:
+            self.console.log(f"AI 处理未完成：{total - unfinished} 条已完成，{unfinished} 条未完成")
+        else:
+            self.console.log("AI 处理完成")
+        if models is not None:
+            models.extend(record_models)
+        return results
 
-            if start_idx != -1 and end_idx != -1:
-                formatted_content = ai_response[start_idx:end_idx + len('# end')]
-                return formatted_content
+    def classify_records(self, categories, records, models=None):
+        """分类全部记录，返回与 records 一一对应的结果（每项为记录行列表，AI 没有完成的记录为 None）
+
+        先查缓存，再用本地规则识别，只把剩下的记录交给 AI（条数对不上的分块由 process_chunks 拆分重试）。
+        对应一行结果的记录写入缓存（日期或金额与原记录对不上的结果不写入，避免错位的结果污染缓存）；
+        部分分块失败时已完成的结果同样写入缓存，下次运行不必重新请求。
+        缓存键使用实际给出结果的模型，切换到候选模型得到的结果不会在下次当作当前模型的结果命中。
+        传入 models 列表时追加每条结果对应的模型（缓存和本地规则的结果记为当前模型）。
+        """
+        results = [None] * len(records)
+        record_models = [self.model_name] * len(records)
+        keys = [None] * len(records)
+        parts = [None] * len(records)
+        if self.cache is not None:
+            categories_hash = self.cache.hash_text(categories)
+            today = datetime.date.today()
+            for i, line in enumerate(records):
+                parts[i] = self.cache.split_line(line, today)
+                if parts[i] is not None:
+                    keys[i] = self.cache.make_key(parts[i][2], categories_hash, self.model_name)
+            hits_before, misses_before = self.cache.hits, self.cache.misses
+            cached = self.cache.get_many([key for key in keys if key is not None])
+            for i, key in enumerate(keys):
+                if key in cached:
+                    date, amount, _ = parts[i]
+                    results[i] = [self.cache.from_value(cached[key], date, amount)]
+            self.emit_records([result[0] for result in results if result is not None])
+            self.console.log(
+                f"缓存命中 {self.cache.hits - hits_before} 条，未命中 {self.cache.misses - misses_before} 条，"
+                f"无法确定日期或金额 {keys.count(None)} 条"
+                f"（累计命中 {self.cache.hits}，未命中 {self.cache.misses}）"
+            )
+            self.metrics.record('cache', hits=self.cache.hits - hits_before,
+                                misses=self.cache.misses - misses_before)
+
+        if self.local_classifier is not None:
+            local_count = 0
+            for i, line in enumerate(records):
+                if results[i] is None:
+                    record_line = self.local_classifier.classify(line)
+                    if record_line is not None:
+                        results[i] = [record_line]
+                        local_count += 1
+                        self.emit_records([record_line])
+            self.console.log(f"本地规则识别 {local_count} 条")
+            self.metrics.record('local_rules', hits=local_count)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            if models is not None:
+                models.extend(record_models)
+            return results
+
+        # 按 token 预算（以及每批条数上限）打包，展开后的结果与 missing 中的记录依次对应
+        self.prompt_builder = PromptBuilder(categories, self.build_prompt, self.input_token_budget,
+                                            self.output_token_budget, self.compact_output)
+        line_chunks = self.prompt_builder.pack([records[i] for i in missing], self.batch_size)
+        ai_models = []
+        ai_results = self.process_chunks(categories, line_chunks, ai_models)
+
+        to_cache = []
+        mismatched = 0
+        for i, lines, model in zip(missing, ai_results, ai_models):
+            results[i] = lines
+            record_models[i] = model
+            if lines is None or keys[i] is None or len(lines) != 1:
+                continue
+            value = self.cache.to_value(lines[0], *parts[i][:2])
+            if value is None:
+                mismatched += 1
+            elif model == self.model_name:
+                to_cache.append((keys[i], value))
+            else:
+                to_cache.append((self.cache.make_key(parts[i][2], categories_hash, model), value))
+        if mismatched:
+            self.console.log(f"{mismatched} 条结果与原记录的日期或金额不一致，不写入缓存")
+        if self.cache is not None:
+            self.cache.put_many(to_cache)
+        if models is not None:
+            models.extend(record_models)
+        return results
+
+    def build_local_classifier(self, categories, output_file):
+        """由分类标准和上次的 config.txt 构建本地规则分类器"""
+        try:
+            classifier = LocalClassifier.from_sources(categories, [output_file])
+        except Exception as e:
+            self.console.log(f"构建本地规则失败: {str(e)}")
+            return None
+        if classifier is None:
+            self.console.log("分类标准中没有可识别的类别规则，跳过本地规则")
             return None
+        self.console.log(f"本地规则关键词 {classifier.keyword_count} 个")
+        return classifier
+
+    def fingerprint_records(self, records):
+        """为每条记录生成指纹；内容相同的记录按出现次序区分"""
+        seen = {}
+        fingerprints = []
+        for line in records:
+            digest = ClassificationCache.hash_text(ClassificationCache.normalize(line))
+            seen[digest] = seen.get(digest, 0) + 1
+            fingerprints.append(f"{digest}#{seen[digest]}")
+        return fingerprints
+
+    def load_processed_state(self, categories_hash):
+        """读取上次运行的处理记录，返回 {指纹: 记录行列表}
+
+        分类标准变化时旧结果作废，返回空字典；由其他模型（如候选模型）给出的结果和空结果也不沿用。
+        """
+        if not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
         except Exception as e:
-            self.console.log(f"提取内容出错: {str(e)}")
+            self.console.log(f"读取处理记录 {self.state_file} 失败: {str(e)}")
+            return {}
+        if state.get('categories_hash') != categories_hash:
+            self.console.log("分类标准已变化，将重新处理全部记录")
+            return {}
+        entries = state.get('entries', [])
+        # 旧版本的处理记录只在顶层记录一个模型
+        # 以前的版本会为条数对不上的分块保存空结果，这些记录需要重新处理
+        entries = [entry for entry in entries if entry.get('lines')]
+        previous = {entry['fp']: entry['lines'] for entry in entries
+                    if entry.get('model', state.get('model')) == self.model_name}
+        if len(previous) < len(entries):
+            self.console.log(f"{len(entries) - len(previous)} 条记录上次由其他模型处理，将重新处理")
+        return previous
+
+    def save_processed_state(self, categories_hash, fingerprints, results, models):
+        """保存本次处理记录及每条结果对应的模型，先写临时文件再替换，避免中断时损坏
+
+        没有结果（None 或空列表）的记录不保存，下次运行会重新处理。
+        """
+        state = {
+            'categories_hash': categories_hash,
+            'entries': [{'fp': fp, 'lines': lines, 'model': model}
+                        for fp, lines, model in zip(fingerprints, results, models) if lines]
+        }
+        tmp_file = self.state_file + '.tmp'
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp_file, self.state_file)
+        except Exception as e:
+            self.console.log(f"保存处理记录失败: {str(e)}")
+
+    def classify_incremental(self, categories, records):
+        """增量分类：沿用上次的结果，只把新增或修改的记录交给 classify_records
+
+        有记录没有完成时仍保存已完成的部分，然后返回 None。
+        """
+        categories_hash = ClassificationCache.hash_text(categories)
+        fingerprints = self.fingerprint_records(records)
+        previous = self.load_processed_state(categories_hash)
+
+        results = [previous.get(fp) for fp in fingerprints]
+        new_indices = [i for i, result in enumerate(results) if result is None]
+        self.emit_records([line for result in results if result for line in result])
+        removed = len(set(previous) - set(fingerprints))
+        self.console.log(
+            f"增量模式：沿用 {len(records) - len(new_indices)} 条，"
+            f"新增或修改 {len(new_indices)} 条，删除 {removed} 条"
+        )
+
+        models = [self.model_name] * len(records)
+        if new_indices:
+            new_models = []
+            new_results = self.classify_records(categories, [records[i] for i in new_indices], new_models)
+            for i, result, model in zip(new_indices, new_results, new_models):
+                results[i] = result
+                models[i] = model
+
+        self.save_processed_state(categories_hash, fingerprints, results, models)
+        if any(result is None for result in results):
             return None
-            
-    def save_to_config(self, content, output_file):
-        """保存到配置文件"""
+        return results
+
+    def parse_records(self, content):
+        """把格式化内容解析为 记录解析.Record 列表，跳过无法解析的行"""
+        records = (parse_line(line) for line in content.splitlines())
+        return [record for record in records if record is not None]
+
+    def build_expense_tracker(self, source=None, date_range=None):
+        """按阈值设置创建大额消费跟踪器，并用历史账本最近一年的记录建立各分类的金额分布
+
+        source 为本次的记账文件，它上次导入、日期在 date_range 内的记录不计入分布（本次结果会再加入）；
+        date_range 为 None 时该文件的记录都不计入。
+        """
+        try:
+            tracker = LargeExpenseTracker.from_settings(self.large_expense_thresholds)
+        except ValueError as e:
+            self.console.log(f"大额阈值设置有误，使用默认阈值: {str(e)}")
+            tracker = LargeExpenseTracker()
+        if self.history_path is None or not os.path.exists(self.history_path):
+            return tracker
+        history = LedgerHistory(self.history_path)
         try:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(content)
+            _, last = history.date_range()
+            if last is not None:
+                with self.metrics.span('fit_expense_history') as span:
+                    records = list(history.iter_records(last - datetime.timedelta(days=365), last,
+                                                        exclude_source=source, exclude_range=date_range))
+                    tracker.fit(records)
+                    span['records'] = len(records)
+        except Exception as e:
+            self.console.log(f"读取历史账本失败: {str(e)}")
+        finally:
+            history.close()
+        return tracker
+
+    def estimate_date_range(self, records):
+        """按原始记录中能识别的日期估计本次结果的日期范围，一条都识别不到时返回 None"""
+        today = datetime.date.today()
+        dates = [extract_date(line, today)[0] for line in records]
+        dates = [date for date in dates if date is not None]
+        return (min(dates), max(dates)) if dates else None
+
+    def update_history(self, records, source, fingerprints=None):
+        """把本次结果并入历史账本（替换该记账文件上次在同一日期范围内的结果），并输出最近一个月与上月的分类对比"""
+        if self.history_path is None or not records:
+            return
+        history = LedgerHistory(self.history_path)
+        try:
+            inserted, removed = history.add_records(records, source, fingerprints)
+            self.console.log(f"历史账本写入 {inserted} 条记录，替换上次导入的 {removed} 条（{self.history_path}）")
+            latest = max(record.date for record in records)
+            self.console.log(f"\n=== {latest.year}年{latest.month:02d}月 与上月对比 ===")
+            for category, current, previous, change, percent in history.compare_months(latest.year, latest.month):
+                percent_text = f"{percent:+.1f}%" if percent is not None else "上月无记录"
+                self.console.log(f"{category}: 本月 {current:.2f}元，上月 {previous:.2f}元，{change:+.2f}元（{percent_text}）")
+        except Exception as e:
+            self.console.log(f"更新历史账本失败: {str(e)}")
+        finally:
+            history.close()
+
+    def save_to_config(self, content, output_file, records=None):
+        """保存到配置文件：先写入 config.txt.partial 再替换，写入失败时保留上次的结果"""
+        try:
+            with self.metrics.span('save_to_config', chars=len(content)):
+                with open(partial_path(output_file), 'w', encoding='utf-8') as f:
+                    f.write(content)
+                os.replace(partial_path(output_file), output_file)
             self.console.log(f"数据已保存到 {output_file}")
-            return True
         except Exception as e:
             self.console.log(f"保存文件出错: {str(e)}")
             return False
+
+        # 同时写入列式存储，可视化时直接加载，不必再逐行解析文本
+        try:
+            if records is None:
+                records = self.parse_records(content)
+            with self.metrics.span('save_columns', records=len(records)):
+                store = RecordStore.from_records(records)
+                path = columns_path(output_file)
+                store.save(path, file_signature(output_file))
+            self.console.log(f"列式数据已保存到 {path}")
+        except Exception as e:
+            self.console.log(f"保存列式数据失败: {str(e)}")
+        return True
             
     def run(self, categories_file, content_file):
-        """运行整个流程"""
+        """运行整个流程，成功返回 True；结束时写入本次运行的汇总指标，并关闭日志文件和缓存连接"""
+        start = time.perf_counter()
+        success = False
+        try:
+            success = self.run_pipeline(categories_file, content_file)
+            return success
+        finally:
+            if not success:
+                self.remove_partial_output()
+            self.record_run_summary(time.perf_counter() - start, success)
+            self.console.close()
+            if self.cache is not None:
+                self.cache.close()
+
+    def remove_partial_output(self):
+        """删除失败或取消的运行留下的 config.txt.partial"""
+        try:
+            os.remove(partial_path(os.path.join(self.output_dir, "config.txt")))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.console.log(f"删除未完成的输出失败: {str(e)}")
+
+    def record_run_summary(self, seconds, success):
+        """写入 run 汇总指标，并把各阶段耗时表输出到日志"""
+        fields = {'success': success, 'records': self.record_count,
+                  'api_calls': self.usage['calls'], 'prompt_tokens': self.usage['prompt_tokens'],
+                  'completion_tokens': self.usage['completion_tokens']}
+        if self.cache is not None:
+            fields.update(cache_hits=self.cache.hits, cache_misses=self.cache.misses)
+        self.metrics.record('run', seconds=seconds, **fields)
+        self.console.log("\n=== 各阶段耗时 ===")
+        self.console.log(self.metrics.format_summary())
+
+    def run_pipeline(self, categories_file, content_file):
+        """读取、分类、保存、可视化，成功返回 True"""
         output_file = os.path.join(self.output_dir, "config.txt")
         
         # 检查文件是否存在
         for file in [categories_file, content_file]:
             if not os.path.exists(file):
                 self.console.log(f"错误: 找不到文件 {file}")
-                return
+                return False
                 
-        # 创建 prompt
-        self.console.log("正在生成处理提示...")
-        prompt = self.create_prompt(categories_file, content_file)
-        
-        # 处理账目
+        self.report_progress('prompt', 0)
+        categories = self.read_file(categories_file)
+        records = self.split_records(self.read_file(content_file))
+        if not records:
+            self.console.log("内容文件中没有需要处理的记录！")
+            return False
+        self.record_count = len(records)
+        if self.use_local_rules:
+            self.local_classifier = self.build_local_classifier(categories, output_file)
+        self.report_progress('prompt', 100)
+
         self.console.log("正在处理账目...")
-        ai_response = self.process_accounts(prompt)
-        
-        if ai_response:
-            formatted_content = self.extract_formatted_content(ai_response)
-            if formatted_content:
-                if self.save_to_config(formatted_content, output_file):
-                    self.console.log("\n开始生成可视化...")
-                    try:
-                        from 可视化 import create_visualizations
-                        create_visualizations(output_file, self.console, self.output_dir)
-                        self.console.log("可视化完成！")
-                    except Exception as e:
-                        self.console.log(f"可视化过程出错: {str(e)}")
+        self.report_progress('api', 0)
+        if self.stream:
+            # 流式结果先写入 config.txt.partial，运行成功后才替换 config.txt
+            self.stream_sink = StreamingSink(self.console, partial_path(output_file),
+                                             self.build_expense_tracker(os.path.abspath(content_file),
+                                                                        self.estimate_date_range(records)))
+        try:
+            with self.metrics.span('classify', records=len(records), incremental=self.incremental):
+                if self.incremental:
+                    results = self.classify_incremental(categories, records)
                 else:
-                    self.console.log("保存文件失败！")
-            else:
-                self.console.log("无法提取格式化内容！")
-        else:
-            self.console.log("AI 处理失败！")
\ No newline at end of file
+                    results = self.classify_records(categories, records)
+        finally:
+            if self.stream_sink is not None:
+                self.stream_sink.close()
+                self.console.log(self.stream_sink.summary())
+                self.stream_sink = None
+        if self.usage['calls']:
+            self.console.log(
+                f"AI 调用 {self.usage['calls']} 次，token 合计：输入 {self.usage['prompt_tokens']}，"
+                f"输出 {self.usage['completion_tokens']}"
+            )
+        if self.is_cancelled():
+            return False
+        if results is None or any(result is None for result in results):
+            self.console.log("AI 处理失败！")
+            return False
+        self.report_progress('api', 100)
+
+        # 每条结果带上其来源记录的指纹，历史账本按 (记账文件, 指纹) 保存
+        lines, fingerprints = [], []
+        for fingerprint, result in zip(self.fingerprint_records(records), results):
+            for n, line in enumerate(result):
+                lines.append(line)
+                fingerprints.append(f"{fingerprint}/{n}")
+        return self.save_and_visualize(lines, output_file, os.path.abspath(content_file), fingerprints)
+
+    def save_and_visualize(self, lines, output_file, source, fingerprints):
+        """保存结果并生成可视化；source 为记账文件，fingerprints 为每行结果的来源记录指纹"""
+        self.report_progress('parse', 0)
+        formatted_content = "# start\n" + "\n".join(lines) + "\n# end"
+        with self.metrics.span('parse_records') as span:
+            records, record_fingerprints = [], []
+            for line, fingerprint in zip(lines, fingerprints):
+                record = parse_line(line)
+                if record is not None:
+                    records.append(record)
+                    record_fingerprints.append(fingerprint)
+            span['records'] = len(records)
+        if not self.save_to_config(formatted_content, output_file, records):
+            self.console.log("保存文件失败！")
+            return False
+        # 先用历史（不含该记账文件上次的结果）建立金额分布，再判断本次的异常消费
+        tracker = self.build_expense_tracker(source, import_range(records) if records else None)
+        with self.metrics.span('update_history', records=len(records)):
+            self.update_history(records, source, record_fingerprints)
+        self.report_progress('parse', 100)
+        if self.is_cancelled():
+            self.console.log("已取消")
+            return False
+
+        self.console.log("\n开始生成可视化...")
+        self.report_progress('charts', 0)
+        try:
+            from 可视化 import create_visualizations
+            with self.metrics.span('create_visualizations'):
+                create_visualizations(output_file, self.console, self.output_dir, self.metrics,
+                                      render=self.render_charts, tracker=tracker)
+            self.console.log("可视化完成！")
+        except Exception as e:
+            self.console.log(f"可视化过程出错: {str(e)}")
+            return False
+        self.report_progress('charts', 100)
+        return True
@@ -0,0 +1,59 @@
+"""客户端复用基准：对本地模拟服务连续运行多次，比较每次新建客户端与共享客户端管理器
+
+用法: python benchmarks/bench_client_reuse.py [--runs 20] [--requests 5] [--latency 0.0]
+每次“运行”发送若干请求（相当于一次分类的多个分块），输出总耗时和服务端看到的 TCP 连接数。
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ai分类 import AccountProcessor
+from mock_openai_server import MockOpenAIServer
+from 客户端管理 import ClientManager
+
+def run_batch(server, runs, requests, shared):
+    """返回 (耗时, 新建连接数)"""
+    records = "\n".join(f"午饭 {i + 10}" for i in range(20))
+    manager = ClientManager() if shared else None
+    before = server.stats['connections']
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(runs):
+            # 未共享时每次运行都用新的管理器，等同于每次点击都新建 OpenAI 客户端
+            run_manager = manager or ClientManager()
+            processor = AccountProcessor('mock-key', server.base_url, 'mock', None, tmp,
+                                         use_cache=False, use_history=False, client_manager=run_manager)
+            prompt = processor.build_prompt("其他", records)
+            for _ in range(requests):
+                processor.request_completion(prompt, max_tokens=1000)
+            if manager is None:
+                run_manager.close()
+    elapsed = time.perf_counter() - start
+    if manager is not None:
+        manager.close()
+    return elapsed, server.stats['connections'] - before
+
+def main():
+    parser = argparse.ArgumentParser(description="比较共享客户端与每次新建客户端")
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=5, help="每次运行的请求数")
+    parser.add_argument('--latency', type=float, default=0.0, help="模拟服务每次请求的延迟（秒）")
+    args = parser.parse_args()
+
+    with MockOpenAIServer(latency=args.latency) as server:
+        total = args.runs * args.requests
+        for label, shared in (("每次新建客户端", False), ("共享客户端管理器", True)):
+            elapsed, connections = run_batch(server, args.runs, args.requests, shared)
+            print(f"{label}: {total} 次请求，{elapsed:.2f} 秒（{elapsed / total * 1000:.1f} 毫秒/次），"
+                  f"新建连接 {connections} 个")
+
+if __name__ == '__main__':
+    main()
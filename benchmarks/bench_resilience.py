@@ -0,0 +1,57 @@
+"""容错测试：模拟服务随机返回 429/500/503，并让首选模型始终不可用，检查分类能否不经人工重跑完成
+
+用法: python benchmarks/bench_resilience.py [--records 200] [--batch-size 10] [--failure-rate 0.3]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ai分类 import AccountProcessor
+from mock_openai_server import MockOpenAIServer
+from 客户端管理 import ClientManager
+from 请求调度 import RequestScheduler
+
+def main():
+    parser = argparse.ArgumentParser(description="注入故障的分类吞吐测试")
+    parser.add_argument('--records', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--failure-rate', type=float, default=0.3)
+    parser.add_argument('--rate', type=float, default=0, help="每秒请求数上限，0 为不限速")
+    args = parser.parse_args()
+
+    records = [f"午饭{i} {i % 90 + 10}" for i in range(args.records)]
+    with MockOpenAIServer(failure_rate=args.failure_rate, failing_models=['primary']) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        scheduler = RequestScheduler(rate=args.rate, base_delay=0.05, max_delay=1.0)
+        processor = AccountProcessor('mock-key', server.base_url, 'primary', None, tmp,
+                                     batch_size=args.batch_size, max_workers=args.workers,
+                                     use_cache=False, use_history=False, use_local_rules=False,
+                                     client_manager=ClientManager(), scheduler=scheduler,
+                                     fallback_models=['backup'])
+        log = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(log):
+            results = processor.classify_records("其他", records)
+            # 不经过 run() 时要自己刷新缓冲，否则定时刷新的日志会在 redirect_stdout 之外输出，也统计不到
+            processor.console.close()
+        elapsed = time.perf_counter() - start
+
+    stats = server.stats
+    completed = all(r is not None for r in results)
+    done = sum(len(r) for r in results if r is not None)
+    switched = log.getvalue().count("切换到下一个模型")
+    print(f"{'完成' if completed else '失败'}: {done}/{args.records} 条，{elapsed:.2f} 秒，{done / elapsed:,.0f} 条/秒")
+    print(f"请求 {stats['requests']} 次，注入错误 {stats['failures']} 次，模型切换 {switched} 次")
+    return 0 if completed else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""启动性能测试：测量从启动进程到主窗口显示的时间
+
+用法:
+    python benchmarks/bench_startup.py                 # 源码运行 main_gui.py
+    python benchmarks/bench_startup.py dist/ai记账/ai记账  # 打包后的程序
+可选 --runs N 指定重复次数（默认 5），--max-seconds 超过时以退出码 1 结束，便于发现回退。
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure(command):
+    """启动一次程序，返回窗口显示所用秒数"""
+    with tempfile.TemporaryDirectory() as tmp:
+        ready_file = os.path.join(tmp, 'ready')
+        env = dict(os.environ, AI_ACCOUNTING_STARTUP_FILE=ready_file)
+        start = time.time()
+        subprocess.run(command, env=env, cwd=ROOT, check=True, timeout=120,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with open(ready_file, 'r', encoding='utf-8') as f:
+            return float(f.read()) - start
+
+def main():
+    parser = argparse.ArgumentParser(description="测量主窗口出现所需时间")
+    parser.add_argument('executable', nargs='?', help="打包后的程序路径，省略时运行源码")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, help="中位数超过该值时返回 1")
+    args = parser.parse_args()
+
+    if args.executable:
+        command, label = [os.path.abspath(args.executable)], "打包程序"
+    else:
+        command, label = [sys.executable, os.path.join(ROOT, 'main_gui.py')], "源码"
+
+    timings = [measure(command) for _ in range(args.runs)]
+    median = statistics.median(timings)
+    print(f"{label}: 最快 {min(timings):.3f} 秒，中位数 {median:.3f} 秒，最慢 {max(timings):.3f} 秒（{args.runs} 次）")
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"启动时间超过 {args.max_seconds:.3f} 秒")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
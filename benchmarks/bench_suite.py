@@ -0,0 +1,180 @@
+"""基准测试套件：完整运行、解析、可视化三类场景，并与保存的基线比较
+
+场景:
+    run/N        AccountProcessor.run 完整流程（本地模拟接口，不用缓存和本地规则）
+    run_local/N  同上，但启用本地规则分类
+    parse/N      parse_config_file 解析 N 行 config.txt
+    visualize/N  create_visualizations（解析、统计、渲染图表）
+
+用法:
+    python benchmarks/bench_suite.py                          # 快速档位，与 benchmarks/baseline.json 比较
+    python benchmarks/bench_suite.py --profile full           # 包括 100 万行
+    python benchmarks/bench_suite.py --save-baseline          # 把本次结果保存为基线
+    python benchmarks/bench_suite.py --only parse --latency 0.2 --tolerance 0.3
+每个场景默认重复 3 次取最快一次；每秒处理条数比基线低于 (1 - tolerance) 时视为回退，以退出码 1 结束。
+基线耗时不到 SHORT_SECONDS 的场景受计时抖动影响大，容差至少取 SHORT_TOLERANCE。
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ledger_generator import write_categories, write_config, write_ledger
+from mock_openai_server import MockOpenAIServer
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+SHORT_SECONDS = 0.1
+SHORT_TOLERANCE = 0.4
+PROFILES = {
+    'quick': {'run': [100, 1000], 'run_local': [1000], 'parse': [10_000, 100_000], 'visualize': [10_000]},
+    'full': {'run': [100, 1000, 10_000], 'run_local': [10_000], 'parse': [10_000, 100_000, 1_000_000],
+             'visualize': [10_000, 100_000, 1_000_000]},
+}
+
+class QuietConsole:
+    """丢弃日志，避免打印开销计入耗时"""
+    def log(self, message, level=None):
+        pass
+
+def bench_run(tmp, count, server, local_rules):
+    from ai分类 import AccountProcessor
+    categories_file = os.path.join(tmp, '分类标准.md')
+    content_file = os.path.join(tmp, f'ledger_{count}.md')
+    write_categories(categories_file)
+    write_ledger(content_file, count)
+    output_dir = tempfile.mkdtemp(dir=tmp)
+    processor = AccountProcessor('mock-key', server.base_url, 'mock', None, output_dir,
+                                 use_cache=False, use_local_rules=local_rules)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        success = processor.run(categories_file, content_file)
+    elapsed = time.perf_counter() - start
+    if not success:
+        raise RuntimeError(f"运行失败（{count} 条）")
+    return elapsed
+
+def bench_parse(tmp, count):
+    from 可视化 import parse_config_file
+    path = os.path.join(tmp, f'config_{count}.txt')
+    if not os.path.exists(path):
+        write_config(path, count)
+    start = time.perf_counter()
+    store = parse_config_file(path, QuietConsole())
+    elapsed = time.perf_counter() - start
+    if store is None or len(store) != count:
+        raise RuntimeError(f"解析结果条数不对（{count} 条）")
+    return elapsed
+
+def bench_visualize(tmp, count):
+    from 可视化 import create_visualizations
+    path = os.path.join(tmp, f'config_{count}.txt')
+    if not os.path.exists(path):
+        write_config(path, count)
+    output_dir = tempfile.mkdtemp(dir=tmp)
+    config_file = os.path.join(output_dir, 'config.txt')
+    shutil.copy(path, config_file)
+    start = time.perf_counter()
+    create_visualizations(config_file, QuietConsole(), output_dir)
+    return time.perf_counter() - start
+
+def run_suite(profile, only, latency, repeat):
+    """返回 {场景/条数: {'seconds', 'records_per_second'}}，重复多次取最快的一次"""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, MockOpenAIServer(latency=latency) as server:
+        # 预热：导入模块，不计入结果
+        if not only or set(only) - {'parse'}:
+            bench_run(tmp, 10, server, False)
+        for scenario, sizes in PROFILES[profile].items():
+            if only and scenario not in only:
+                continue
+            for count in sizes:
+                if scenario == 'run':
+                    measure = lambda: bench_run(tmp, count, server, False)
+                elif scenario == 'run_local':
+                    measure = lambda: bench_run(tmp, count, server, True)
+                elif scenario == 'parse':
+                    measure = lambda: bench_parse(tmp, count)
+                else:
+                    measure = lambda: bench_visualize(tmp, count)
+                seconds = min(measure() for _ in range(repeat))
+                name = f"{scenario}/{count}"
+                results[name] = {'seconds': round(seconds, 4), 'records_per_second': round(count / seconds, 1)}
+                print(f"{name:<22}{seconds:>10.3f} 秒{count / seconds:>14,.0f} 条/秒", flush=True)
+    return results
+
+def compare(results, baseline, tolerance):
+    """与基线比较，返回回退的场景列表；基线耗时很短的场景放宽容差"""
+    regressions = []
+    print(f"\n{'场景':<20}{'基线 条/秒':>14}{'本次 条/秒':>14}{'变化':>10}")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<22}{'-':>14}{current['records_per_second']:>16,.0f}{'新增':>10}")
+            continue
+        ratio = current['records_per_second'] / previous['records_per_second']
+        allowed = max(tolerance, SHORT_TOLERANCE) if previous['seconds'] < SHORT_SECONDS else tolerance
+        flag = ''
+        if ratio < 1 - allowed:
+            regressions.append(name)
+            flag = '  回退'
+        print(f"{name:<22}{previous['records_per_second']:>14,.0f}{current['records_per_second']:>16,.0f}"
+              f"{(ratio - 1) * 100:>+9.1f}%{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="记账程序基准测试套件")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick')
+    parser.add_argument('--only', action='append', choices=['run', 'run_local', 'parse', 'visualize'],
+                        help="只运行指定场景，可重复指定")
+    parser.add_argument('--latency', type=float, default=0.05, help="模拟接口每次请求的延迟（秒）")
+    parser.add_argument('--repeat', type=int, default=3, help="每个场景重复次数，取最快一次")
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help="把本次结果写入基线文件")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="允许的吞吐下降比例")
+    parser.add_argument('--output', help="本次结果另存为 JSON")
+    args = parser.parse_args()
+
+    results = run_suite(args.profile, args.only, args.latency, max(1, args.repeat))
+    report = {'python': platform.python_version(), 'platform': platform.platform(),
+              'latency': args.latency, 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f).get('results', {})
+        report['results'] = dict(baseline, **results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存到 {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\n没有基线文件 {args.baseline}，用 --save-baseline 生成")
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('latency') != args.latency:
+        print(f"\n注意：基线的模拟延迟为 {baseline.get('latency')} 秒，本次为 {args.latency} 秒")
+    regressions = compare(results, baseline.get('results', {}), args.tolerance)
+    if regressions:
+        print(f"\n性能回退: {', '.join(regressions)}")
+        return 1
+    print("\n没有发现性能回退")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""生成基准测试用的数据：中文自然语言记账内容、分类标准和 config.txt
+
+用法:
+    python benchmarks/ledger_generator.py ledger 1000 -o 记账内容.md
+    python benchmarks/ledger_generator.py config 1000000 -o config.txt
+    python benchmarks/ledger_generator.py categories -o 分类标准.md
+"""
+import argparse
+import datetime
+import random
+import sys
+
+# 类别及其常见消费名称
+CATEGORY_ITEMS = {
+    '餐饮': ['早餐', '午饭', '晚饭', '外卖', '火锅', '烧烤', '麦当劳', '食堂'],
+    '饮料': ['咖啡', '奶茶', '星巴克', '矿泉水', '果汁'],
+    '交通': ['地铁', '公交', '打车', '滴滴', '加油', '停车费', '高铁票'],
+    '购物': ['超市', '淘宝', '京东', '衣服', '鞋子', '日用品'],
+    '娱乐': ['电影票', 'KTV', '游戏充值', '演唱会', '健身房'],
+    '住房': ['房租', '水费', '电费', '燃气费', '物业费', '宽带'],
+    '医疗': ['挂号', '感冒药', '体检', '牙医'],
+}
+# 各类别金额范围（元）
+AMOUNT_RANGES = {
+    '餐饮': (8, 150), '饮料': (5, 45), '交通': (2, 300), '购物': (10, 800),
+    '娱乐': (30, 600), '住房': (50, 4000), '医疗': (10, 1500),
+}
+# 自然语言记账的几种写法
+TEMPLATES = [
+    "{month}月{day}日 {item} {amount}元",
+    "{month}月{day}日{verb}{item}花了{amount}",
+    "{year}-{month:02d}-{day:02d} {item} {amount}",
+    "{month}/{day} {item} {amount}块",
+    "{month}月{day}号 和朋友{verb}{item}，{amount}元",
+]
+VERBS = ['买', '吃', '付', '交', '去']
+
+def random_entry(rng, start, days):
+    """随机生成一条记录：(日期, 类别, 名称, 金额)"""
+    category = rng.choice(list(CATEGORY_ITEMS))
+    item = rng.choice(CATEGORY_ITEMS[category])
+    low, high = AMOUNT_RANGES[category]
+    # 金额偏向低值，偶尔出现大额
+    amount = round(min(high, low + rng.expovariate(4 / (high - low))), 2)
+    date = start + datetime.timedelta(days=rng.randrange(days))
+    return date, category, item, amount
+
+def generate_ledger(count, seed=0, start=datetime.date(2024, 1, 1), days=365):
+    """产出 count 行自然语言记账内容"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        date, _, item, amount = random_entry(rng, start, days)
+        amount_text = f"{amount:g}" if rng.random() < 0.7 else f"{amount:.2f}"
+        yield rng.choice(TEMPLATES).format(year=date.year, month=date.month, day=date.day,
+                                           item=item, amount=amount_text, verb=rng.choice(VERBS))
+
+def generate_config(count, seed=0, start=datetime.date(2024, 1, 1), days=365):
+    """产出 count 行 DATE/TYPE/NAME/COST 格式的记录"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        date, category, item, amount = random_entry(rng, start, days)
+        yield f"DATE:{date.isoformat()} TYPE:{category} NAME:{item} COST:{amount:.2f}"
+
+def categories_text():
+    """与生成数据对应的分类标准（“类别: 关键词、关键词”格式）"""
+    return "\n".join(f"{category}: {'、'.join(items)}" for category, items in CATEGORY_ITEMS.items()) + "\n"
+
+def write_ledger(path, count, seed=0):
+    with open(path, 'w', encoding='utf-8') as f:
+        for line in generate_ledger(count, seed):
+            f.write(line + '\n')
+
+def write_config(path, count, seed=0):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('# start\n')
+        for line in generate_config(count, seed):
+            f.write(line + '\n')
+        f.write('# end\n')
+
+def write_categories(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(categories_text())
+
+def main():
+    parser = argparse.ArgumentParser(description="生成基准测试数据")
+    parser.add_argument('kind', choices=['ledger', 'config', 'categories'])
+    parser.add_argument('count', type=int, nargs='?', default=1000, help="记录条数（10 到 1000000）")
+    parser.add_argument('-o', '--output', required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.kind == 'categories':
+        write_categories(args.output)
+    elif args.kind == 'ledger':
+        write_ledger(args.output, args.count, args.seed)
+    else:
+        write_config(args.output, args.count, args.seed)
+    print(f"已生成 {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""本地 OpenAI 兼容接口（/v1/chat/completions），用于基准测试，不消耗真实 API
+
+对 prompt 中的每条记录生成一行结果，支持流式（SSE）和非流式响应，使用 HTTP/1.1 长连接，
+并统计建立的 TCP 连接数和请求数，用来比较连接复用的效果。
+可以注入故障：按比例随机返回 429/500/503，或让指定模型始终返回 503，用来测试重试和模型切换。
+
+单独运行: python benchmarks/mock_openai_server.py --port 8000 --latency 0.2 --failure-rate 0.2
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ledger_generator import CATEGORY_ITEMS
+
+AMOUNT_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+DATE_PATTERNS = [
+    re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})'),
+    re.compile(r'()(\d{1,2})\s*月\s*(\d{1,2})\s*[日号]?'),
+    re.compile(r'()(\d{1,2})/(\d{1,2})'),
+]
+# 名称到类别，使生成的结果有多个类别
+ITEM_CATEGORIES = {item: category for category, items in CATEGORY_ITEMS.items() for item in items}
+
+def extract_records(prompt):
+    """从标准或紧凑格式的 prompt 中取出需要转换的记录行"""
+    if '【需要转换的消费记录】' in prompt:
+        body = prompt.split('【需要转换的消费记录】\n', 1)[1].split('\n```', 1)[0]
+    elif '记录：\n' in prompt:
+        body = prompt.split('记录：\n', 1)[1]
+    else:
+        body = ''
+    return [line.strip() for line in body.splitlines() if line.strip()]
+
+def fake_classify(record):
+    """粗略识别一条记录：(日期, 类别, 名称, 金额)；日期没有年份时按 2024 年"""
+    date = '2024-01-01'
+    for pattern in DATE_PATTERNS:
+        match = pattern.search(record)
+        if match:
+            year, month, day = match.groups()
+            date = f"{year or 2024}-{int(month):02d}-{int(day):02d}"
+            record = record[:match.start()] + record[match.end():]
+            break
+    amounts = AMOUNT_PATTERN.findall(record)
+    amount = float(amounts[-1]) if amounts else 0.0
+    category = next((c for item, c in ITEM_CATEGORIES.items() if item in record), '其他')
+    name = next((item for item in ITEM_CATEGORIES if item in record), None)
+    name = name or re.sub(r'[\s，,]+', ' ', AMOUNT_PATTERN.sub('', record)).strip() or '未知'
+    return date, category, name, amount
+
+def fake_completion(prompt):
+    """为每条记录生成一行结果"""
+    compact = '类别编号' in prompt
+    codes = {}
+    if compact:
+        codes = {name: code for code, name in re.findall(r'^(\d+)=([^（\n]+)', prompt, re.M)}
+    lines = []
+    for record in extract_records(prompt):
+        date, category, name, amount = fake_classify(record)
+        if compact:
+            lines.append(f"{date}\t{codes.get(category, 1)}\t{name}\t{amount:.2f}")
+        else:
+            lines.append(f"DATE:{date} TYPE:{category} NAME:{name} COST:{amount:.2f}")
+    return "# start\n" + "\n".join(lines) + "\n# end\n"
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.stats_lock:
+            self.server.stats['connections'] += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        with self.server.stats_lock:
+            self.server.stats['requests'] += 1
+        if not self.path.endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+
+        failure = self.server.pick_failure(request.get('model'))
+        if failure:
+            with self.server.stats_lock:
+                self.server.stats['failures'] += 1
+            body = json.dumps({'error': {'message': f'injected {failure}', 'type': 'mock'}}).encode('utf-8')
+            self.send_response(failure)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if failure == 429:
+                self.send_header('Retry-After', '0.05')
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        prompt = request['messages'][-1]['content']
+        content = fake_completion(prompt)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        usage = {'prompt_tokens': len(prompt) // 2, 'completion_tokens': len(content) // 2,
+                 'total_tokens': (len(prompt) + len(content)) // 2}
+        base = {'id': 'chatcmpl-mock', 'created': int(time.time()), 'model': request.get('model', 'mock')}
+        if not request.get('stream'):
+            self._send_json(200, dict(base, object='chat.completion', usage=usage, choices=[{
+                'index': 0, 'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': content},
+            }]))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        pieces = [content[i:i + 64] for i in range(0, len(content), 64)]
+        events = [dict(base, object='chat.completion.chunk', choices=[{
+            'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]) for piece in pieces]
+        events.append(dict(base, object='chat.completion.chunk', choices=[], usage=usage))
+        for event in events:
+            self.wfile.write(self._chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8')))
+            self.wfile.flush()
+        # [DONE] 与结束块一起发送，客户端读到 [DONE] 时响应已完整，连接可以放回连接池
+        self.wfile.write(self._chunk(b"data: [DONE]\n\n") + self._chunk(b""))
+        self.wfile.flush()
+
+    @staticmethod
+    def _chunk(data):
+        return f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n"
+
+class MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def pick_failure(self, model):
+        """返回本次要注入的错误状态码，不注入时返回 None"""
+        if model in self.failing_models:
+            return 503
+        with self.stats_lock:
+            if self.failure_rate and self.rng.random() < self.failure_rate:
+                return self.rng.choice((429, 500, 503))
+        return None
+
+class MockOpenAIServer:
+    """在后台线程中运行的模拟服务
+
+    latency 为每次请求的固定延迟（秒）；failure_rate 为随机返回 429/500/503 的比例；
+    failing_models 中的模型始终返回 503。
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0, failing_models=(), seed=0):
+        self.httpd = MockHTTPServer((host, port), MockHandler)
+        self.httpd.latency = latency
+        self.httpd.failure_rate = failure_rate
+        self.httpd.failing_models = set(failing_models)
+        self.httpd.rng = random.Random(seed)
+        self.httpd.stats = {'connections': 0, 'requests': 0, 'failures': 0}
+        self.httpd.stats_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def stats(self):
+        with self.httpd.stats_lock:
+            return dict(self.httpd.stats)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容模拟服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help="每次请求的延迟（秒）")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="随机返回 429/500/503 的比例")
+    parser.add_argument('--fail-model', action='append', default=[], help="始终返回 503 的模型，可重复指定")
+    args = parser.parse_args()
+    server = MockOpenAIServer(args.host, args.port, args.latency, args.failure_rate, args.fail_model)
+    print(f"模拟服务已启动: {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == '__main__':
+    main()
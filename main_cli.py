@@ -0,0 +1,146 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ai分类 import AccountProcessor
+from 可视化 import DEBUG, INFO
+from 客户端管理 import get_client_manager
+from 请求调度 import get_request_scheduler
+
+# 退出码
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="记账程序命令行版：批量分类记账内容并生成统计")
+    parser.add_argument('inputs', nargs='+', help="记账内容文件、目录（处理其中的 .md 文件）或通配符")
+    parser.add_argument('--categories', default="分类标准.md", help="分类标准文件")
+    parser.add_argument('--api-key', default=os.environ.get('OPENAI_API_KEY', ''),
+                        help="API Key，默认读取环境变量 OPENAI_API_KEY")
+    parser.add_argument('--base-url', default="https://api.deepseek.com/v1")
+    parser.add_argument('--model', default="deepseek-chat")
+    parser.add_argument('--fallback-models', default="",
+                        help="当前模型持续不可用时依次切换的模型，逗号分隔")
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help="同一接口每秒最多请求数，0 为不限速")
+    parser.add_argument('--api-retries', type=int, default=4, help="限流或服务端错误时单次请求的重试次数")
+    parser.add_argument('--output-dir', default="output", help="输出根目录，每个文件输出到其中的同名子目录")
+    parser.add_argument('--workers', type=int, default=2, help="同时处理的文件数")
+    parser.add_argument('--batch-size', type=int, default=0, help="每批记录条数上限，0 为只按 token 预算分块")
+    parser.add_argument('--input-tokens', type=int, default=6000, help="每次请求的输入 token 预算")
+    parser.add_argument('--output-tokens', type=int, default=4000, help="每次请求的输出 token 上限")
+    parser.add_argument('--compact', action='store_true', help="使用类别编号的紧凑输出格式")
+    parser.add_argument('--chunk-workers', type=int, default=4, help="单个文件内的分块并发数")
+    parser.add_argument('--timeout', type=float, default=120, help="单次请求超时（秒）")
+    parser.add_argument('--max-connections', type=int, default=8,
+                        help="同一接口同时进行的请求数上限（所有文件合计）")
+    parser.add_argument('--no-cache', action='store_true', help="不使用分类缓存")
+    parser.add_argument('--incremental', action='store_true', help="增量处理")
+    parser.add_argument('--stream', action='store_true', help="流式输出")
+    parser.add_argument('--no-local-rules', action='store_true', help="不使用本地规则分类")
+    parser.add_argument('--no-charts', action='store_true', help="不生成 PNG 图表")
+    parser.add_argument('--large-thresholds', default="",
+                        help="大额消费阈值，如 \"30,住房=3000,医疗=500\"：单独的数字为默认阈值，其余按分类设置")
+    parser.add_argument('--verbose', action='store_true', help="在控制台显示逐条记录等详细日志（始终写入 run.log）")
+    parser.add_argument('--summary', help="运行摘要 JSON 的路径，默认为 输出根目录/summary.json")
+    return parser.parse_args(argv)
+
+def collect_inputs(patterns):
+    """展开目录和通配符，返回去重后的文件列表"""
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '*.md')))
+        else:
+            matches = sorted(glob.glob(pattern)) or ([pattern] if os.path.isfile(pattern) else [])
+        for path in matches:
+            path = os.path.abspath(path)
+            if path not in files:
+                files.append(path)
+    return files
+
+def output_dirs_for(files, output_root):
+    """每个文件的输出目录，同名文件加序号区分"""
+    used = {}
+    dirs = []
+    for path in files:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        used[stem] = used.get(stem, 0) + 1
+        name = stem if used[stem] == 1 else f"{stem}_{used[stem]}"
+        dirs.append(os.path.join(output_root, name))
+    return dirs
+
+def process_file(args, content_file, output_dir):
+    """处理单个文件，返回摘要条目"""
+    start = time.perf_counter()
+    entry = {'file': content_file, 'output_dir': output_dir, 'success': False, 'error': None}
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        processor = AccountProcessor(args.api_key, args.base_url, args.model, None, output_dir,
+                                     batch_size=args.batch_size,
+                                     max_workers=args.chunk_workers,
+                                     use_cache=not args.no_cache,
+                                     incremental=args.incremental,
+                                     stream=args.stream,
+                                     use_local_rules=not args.no_local_rules,
+                                     input_token_budget=args.input_tokens,
+                                     output_token_budget=args.output_tokens,
+                                     compact_output=args.compact,
+                                     log_level=DEBUG if args.verbose else INFO,
+                                     render_charts=not args.no_charts,
+                                     large_expense_thresholds=args.large_thresholds,
+                                     fallback_models=[m.strip() for m in args.fallback_models.split(',') if m.strip()])
+        entry['success'] = bool(processor.run(args.categories, content_file))
+    except Exception as e:
+        entry['error'] = f"{type(e).__name__}: {str(e)}"
+    entry['seconds'] = round(time.perf_counter() - start, 3)
+    return entry
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.api_key:
+        print("错误：请通过 --api-key 或环境变量 OPENAI_API_KEY 提供 API Key", file=sys.stderr)
+        return EXIT_USAGE
+    if not os.path.exists(args.categories):
+        print(f"错误: 找不到分类文件 {args.categories}", file=sys.stderr)
+        return EXIT_USAGE
+    files = collect_inputs(args.inputs)
+    if not files:
+        print("错误：没有找到需要处理的文件", file=sys.stderr)
+        return EXIT_USAGE
+
+    start = time.perf_counter()
+    # 所有文件共用同一个客户端及连接池
+    get_client_manager().configure(timeout=args.timeout, max_concurrency=args.max_connections)
+    get_request_scheduler().configure(rate=args.rate_limit, max_retries=args.api_retries)
+    dirs = output_dirs_for(files, args.output_dir)
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        entries = list(executor.map(lambda item: process_file(args, *item), zip(files, dirs)))
+
+    failed = [entry for entry in entries if not entry['success']]
+    summary = {
+        'total_seconds': round(time.perf_counter() - start, 3),
+        'succeeded': len(entries) - len(failed),
+        'failed': len(failed),
+        'files': entries,
+    }
+    summary_path = args.summary or os.path.join(args.output_dir, 'summary.json')
+    os.makedirs(os.path.dirname(os.path.abspath(summary_path)), exist_ok=True)
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    for entry in entries:
+        status = "成功" if entry['success'] else "失败"
+        print(f"[{status}] {entry['file']}  {entry['seconds']:.2f} 秒" + (f"  {entry['error']}" if entry['error'] else ""))
+    print(f"共 {len(entries)} 个文件，成功 {summary['succeeded']}，失败 {summary['failed']}；摘要: {summary_path}")
+    return EXIT_FAILED if failed else EXIT_OK
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -1,15 +1,78 @@
+import multiprocessing
 import os
+import threading
 import time
+from collections import deque
 
-from PyQt5.QtCore import QSettings
+from PyQt5.QtCore import QSettings, QObject, QThread, QTimer, pyqtSignal
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                             QHBoxLayout, QLabel, QLineEdit, QPushButton, 
-                            QTextEdit, QFileDialog, QComboBox)
+                            QTextEdit, QFileDialog, QComboBox, QSpinBox, QCheckBox,
+                            QProgressBar, QTableWidget, QTableWidgetItem)
 from PyQt5.QtGui import QIcon  # 确保正确导入 QIcon
 
-from ai分类 import AccountProcessor
 import sys
 
+# 进度条对应的处理阶段
+STAGES = [('prompt', '生成提示'), ('api', '调用API'), ('parse', '解析保存'), ('charts', '生成图表')]
+
+class SignalWriter:
+    """供 ConsoleOutput 使用的输出对象，把日志转成 Qt 信号交给 GUI 线程显示"""
+    def __init__(self, signal):
+        self.signal = signal
+
+    def append(self, text):
+        self.signal.emit(text)
+
+class ClassificationWorker(QObject):
+    """在后台线程中运行 AccountProcessor"""
+    log = pyqtSignal(str)
+    progress = pyqtSignal(str, int)
+    metrics = pyqtSignal(list)
+    finished = pyqtSignal(bool, float)
+
+    def __init__(self, job):
+        super().__init__()
+        self.job = job
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        start_time = time.time()
+        success = False
+        try:
+            # 处理模块（openai、numpy 等）在第一次运行时才导入，加快窗口出现
+            from ai分类 import AccountProcessor
+            from 可视化 import DEBUG, INFO
+            from 客户端管理 import get_client_manager
+            from 请求调度 import get_request_scheduler
+            job = self.job
+            # 客户端和调度器跨任务复用，这里只更新超时和限速设置
+            get_client_manager().configure(timeout=job['timeout'])
+            get_request_scheduler().configure(rate=job['rate_limit'])
+            processor = AccountProcessor(job['api_key'], job['base_url'], job['model_name'],
+                                         SignalWriter(self.log), job['output_dir'],
+                                         batch_size=job['batch_size'],
+                                         max_workers=job['max_workers'],
+                                         use_cache=job['use_cache'],
+                                         incremental=job['incremental'],
+                                         stream=job['stream'],
+                                         use_local_rules=job['use_local_rules'],
+                                         compact_output=job['compact_output'],
+                                         fallback_models=job['fallback_models'],
+                                         log_level=DEBUG if job['verbose_log'] else INFO,
+                                         render_charts=job['render_charts'],
+                                         large_expense_thresholds=job['large_thresholds'],
+                                         progress_callback=self.progress.emit,
+                                         cancel_event=self.cancel_event)
+            success = processor.run(job['categories_file'], job['content_file'])
+            self.metrics.emit(processor.metrics.summary())
+        except Exception as e:
+            self.log.emit(f"发生错误：{str(e)}")
+        self.finished.emit(bool(success), time.time() - start_time)
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -65,10 +128,74 @@ class MainWindow(QMainWindow):
         
         layout.addLayout(file_layout)
         
-        # 运行按钮
+        # 分批设置
+        batch_layout = QHBoxLayout()
+        batch_layout.addWidget(QLabel("每批最多条数(0为按token预算):"))
+        self.batch_size = QSpinBox()
+        self.batch_size.setRange(0, 1000)
+        batch_layout.addWidget(self.batch_size)
+        batch_layout.addWidget(QLabel("并发数:"))
+        self.max_workers = QSpinBox()
+        self.max_workers.setRange(1, 32)
+        self.max_workers.setValue(4)
+        batch_layout.addWidget(self.max_workers)
+        batch_layout.addWidget(QLabel("超时(秒):"))
+        self.timeout = QSpinBox()
+        self.timeout.setRange(10, 600)
+        self.timeout.setValue(120)
+        batch_layout.addWidget(self.timeout)
+        batch_layout.addWidget(QLabel("每秒请求数(0为不限):"))
+        self.rate_limit = QSpinBox()
+        self.rate_limit.setRange(0, 100)
+        batch_layout.addWidget(self.rate_limit)
+        self.use_cache = QCheckBox("使用分类缓存")
+        self.use_cache.setChecked(True)
+        batch_layout.addWidget(self.use_cache)
+        self.incremental = QCheckBox("增量处理")
+        batch_layout.addWidget(self.incremental)
+        self.stream = QCheckBox("流式输出")
+        batch_layout.addWidget(self.stream)
+        self.use_local_rules = QCheckBox("本地规则")
+        self.use_local_rules.setChecked(True)
+        batch_layout.addWidget(self.use_local_rules)
+        self.compact_output = QCheckBox("紧凑输出")
+        batch_layout.addWidget(self.compact_output)
+        batch_layout.addStretch()
+        layout.addLayout(batch_layout)
+        
+        # 运行和取消按钮
+        run_layout = QHBoxLayout()
         run_btn = QPushButton("运行分类")
         run_btn.clicked.connect(self.run_classification)
-        layout.addWidget(run_btn)
+        run_layout.addWidget(run_btn)
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_classification)
+        run_layout.addWidget(self.cancel_btn)
+        self.queue_label = QLabel("")
+        run_layout.addWidget(self.queue_label)
+        run_layout.addStretch()
+        self.render_charts = QCheckBox("生成PNG图表")
+        run_layout.addWidget(self.render_charts)
+        dashboard_btn = QPushButton("仪表盘")
+        dashboard_btn.clicked.connect(self.open_dashboard)
+        run_layout.addWidget(dashboard_btn)
+        self.verbose_log = QCheckBox("详细日志")
+        run_layout.addWidget(self.verbose_log)
+        self.show_metrics = QCheckBox("显示耗时统计")
+        run_layout.addWidget(self.show_metrics)
+        layout.addLayout(run_layout)
+
+        # 各阶段进度
+        progress_layout = QHBoxLayout()
+        self.progress_bars = {}
+        for stage, title in STAGES:
+            progress_layout.addWidget(QLabel(title))
+            bar = QProgressBar()
+            bar.setRange(0, 100)
+            progress_layout.addWidget(bar)
+            self.progress_bars[stage] = bar
+        layout.addLayout(progress_layout)
         
         # 添加输出目录设置
         output_layout = QHBoxLayout()
@@ -78,13 +205,35 @@ class MainWindow(QMainWindow):
         browse_output_btn = QPushButton("浏览...")
         browse_output_btn.clicked.connect(self.select_output_dir)
         output_layout.addWidget(browse_output_btn)
+        output_layout.addWidget(QLabel("大额阈值:"))
+        self.large_thresholds = QLineEdit("30")
+        self.large_thresholds.setToolTip("单独的数字为默认阈值，按分类设置用 分类=金额，如 30, 住房=3000, 医疗=500")
+        output_layout.addWidget(self.large_thresholds)
         layout.addLayout(output_layout)
 
         # 结果输出
         self.output_area = QTextEdit()
         self.output_area.setReadOnly(True)
+        # 限制保留的日志段数，长时间运行时界面内存不再增长
+        self.output_area.document().setMaximumBlockCount(5000)
         layout.addWidget(self.output_area)
+
+        # 各阶段耗时统计（可选显示）
+        self.metrics_table = QTableWidget(0, 5)
+        self.metrics_table.setHorizontalHeaderLabels(["阶段", "次数", "耗时(秒)", "记录数", "条/秒"])
+        self.metrics_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.metrics_table.setMaximumHeight(200)
+        self.metrics_table.setVisible(False)
+        self.show_metrics.toggled.connect(self.metrics_table.setVisible)
+        layout.addWidget(self.metrics_table)
         
+        self.dashboard = None
+
+        # 排队中的任务和当前后台任务
+        self.pending_jobs = deque()
+        self.worker = None
+        self.worker_thread = None
+
         # 加载上一次的settings
         self.load_settings()
 
@@ -96,6 +245,19 @@ class MainWindow(QMainWindow):
         self.categories_file.setText(self.settings.value("categories_file", "分类标准.md"))
         self.content_file.setText(self.settings.value("content_file", "记账内容.md"))
         self.output_dir.setText(self.settings.value("output_dir", "output"))
+        self.batch_size.setValue(int(self.settings.value("batch_size", 0)))
+        self.max_workers.setValue(int(self.settings.value("max_workers", 4)))
+        self.timeout.setValue(int(self.settings.value("timeout", 120)))
+        self.rate_limit.setValue(int(self.settings.value("rate_limit", 0)))
+        self.use_cache.setChecked(self.settings.value("use_cache", True, type=bool))
+        self.incremental.setChecked(self.settings.value("incremental", False, type=bool))
+        self.stream.setChecked(self.settings.value("stream", False, type=bool))
+        self.use_local_rules.setChecked(self.settings.value("use_local_rules", True, type=bool))
+        self.compact_output.setChecked(self.settings.value("compact_output", False, type=bool))
+        self.show_metrics.setChecked(self.settings.value("show_metrics", False, type=bool))
+        self.verbose_log.setChecked(self.settings.value("verbose_log", False, type=bool))
+        self.render_charts.setChecked(self.settings.value("render_charts", False, type=bool))
+        self.large_thresholds.setText(self.settings.value("large_thresholds", "30"))
 
     def save_settings(self):
         """保存当前设置"""
@@ -105,11 +267,29 @@ class MainWindow(QMainWindow):
         self.settings.setValue("categories_file", self.categories_file.text())
         self.settings.setValue("content_file", self.content_file.text())
         self.settings.setValue("output_dir", self.output_dir.text())
+        self.settings.setValue("batch_size", self.batch_size.value())
+        self.settings.setValue("max_workers", self.max_workers.value())
+        self.settings.setValue("timeout", self.timeout.value())
+        self.settings.setValue("rate_limit", self.rate_limit.value())
+        self.settings.setValue("use_cache", self.use_cache.isChecked())
+        self.settings.setValue("incremental", self.incremental.isChecked())
+        self.settings.setValue("stream", self.stream.isChecked())
+        self.settings.setValue("use_local_rules", self.use_local_rules.isChecked())
+        self.settings.setValue("compact_output", self.compact_output.isChecked())
+        self.settings.setValue("show_metrics", self.show_metrics.isChecked())
+        self.settings.setValue("verbose_log", self.verbose_log.isChecked())
+        self.settings.setValue("render_charts", self.render_charts.isChecked())
+        self.settings.setValue("large_thresholds", self.large_thresholds.text())
 
 
     def closeEvent(self, event):
-        """窗口关闭时保存设置"""
+        """窗口关闭时保存设置，并等待后台任务结束"""
         self.save_settings()
+        self.pending_jobs.clear()
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker_thread.quit()
+            self.worker_thread.wait()
         event.accept()
 
     def get_resource_path(self, relative_path):
@@ -142,49 +322,145 @@ class MainWindow(QMainWindow):
             self.output_dir.setText(dir_path)
 
     def append_output(self, text):
-        """实时显示输出内容"""
+        """显示输出内容；后台线程的日志经信号转到 GUI 线程后调用"""
         self.output_area.append(text)
-        self.output_area.repaint()  # 强制刷新界面
-        QApplication.processEvents()  # 处理事件队列，确保界面更新
 
     def run_classification(self):
+        """把当前设置加入任务队列，空闲时立即开始运行"""
         try:
-            """运行分类程序"""
-            self.output_area.clear()
-            start_time = time.time()
-            self.append_output("开始运行分类...\n大概需要2分钟请等待...")
-
             # 获取输入
-            api_key = self.api_input.text()
-            base_url = self.url_input.text()
-            model_name = self.model_combo.currentText()
-            categories_file = self.categories_file.text()
-            content_file = self.content_file.text()
-            output_dir = self.output_dir.text()
+            job = {
+                'api_key': self.api_input.text(),
+                'base_url': self.url_input.text(),
+                'model_name': self.model_combo.currentText(),
+                # 当前模型持续不可用时按列表顺序切换到其他模型
+                'fallback_models': [self.model_combo.itemText(i) for i in range(self.model_combo.count())],
+                'categories_file': self.categories_file.text(),
+                'content_file': self.content_file.text(),
+                'output_dir': self.output_dir.text(),
+                'batch_size': self.batch_size.value(),
+                'max_workers': self.max_workers.value(),
+                'timeout': self.timeout.value(),
+                'rate_limit': self.rate_limit.value(),
+                'use_cache': self.use_cache.isChecked(),
+                'incremental': self.incremental.isChecked(),
+                'stream': self.stream.isChecked(),
+                'use_local_rules': self.use_local_rules.isChecked(),
+                'compact_output': self.compact_output.isChecked(),
+                'verbose_log': self.verbose_log.isChecked(),
+                'render_charts': self.render_charts.isChecked(),
+                'large_thresholds': self.large_thresholds.text(),
+            }
             
-            if not api_key:
+            if not job['api_key']:
                 self.append_output("错误：请先输入API Key")
                 return
                 
             # 创建输出目录
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-                
-            # 初始化处理器
-            
-            processor = AccountProcessor(api_key, base_url, model_name, self.output_area, output_dir)
-            processor.run(categories_file, content_file)
-            elapsed_time = time.time() - start_time
-            self.append_output(f"分类完成，总耗时: {elapsed_time:.2f} 秒")
-    
-                
+            if not os.path.exists(job['output_dir']):
+                os.makedirs(job['output_dir'])
+
+            if self.worker is None:
+                self.output_area.clear()
+            self.pending_jobs.append(job)
+            self.start_next_job()
         except Exception as e:
             self.output_area.append(f"发生错误：{str(e)}")
 
+    def start_next_job(self):
+        """当前没有任务运行时，从队列取出下一个任务放到后台线程执行"""
+        self.update_queue_label()
+        if self.worker is not None or not self.pending_jobs:
+            return
+        job = self.pending_jobs.popleft()
+        self.update_queue_label()
+        for bar in self.progress_bars.values():
+            bar.setValue(0)
+        self.append_output(f"开始运行分类: {job['content_file']}\n大概需要2分钟请等待...")
+
+        self.worker_thread = QThread()
+        self.worker = ClassificationWorker(job)
+        self.worker.moveToThread(self.worker_thread)
+        self.worker_thread.started.connect(self.worker.run)
+        self.worker.log.connect(self.append_output)
+        self.worker.progress.connect(self.update_progress)
+        self.worker.metrics.connect(self.update_metrics)
+        self.worker.finished.connect(self.on_job_finished)
+        self.worker_thread.finished.connect(self.worker.deleteLater)
+        self.cancel_btn.setEnabled(True)
+        self.worker_thread.start()
+
+    def cancel_classification(self):
+        """取消当前任务并清空队列"""
+        self.pending_jobs.clear()
+        self.update_queue_label()
+        if self.worker is not None:
+            self.append_output("正在取消...")
+            self.worker.cancel()
+
+    def update_progress(self, stage, percent):
+        if stage in self.progress_bars:
+            self.progress_bars[stage].setValue(percent)
+
+    def open_dashboard(self):
+        """打开（或切换到）当前输出目录的仪表盘"""
+        try:
+            # matplotlib 的 Qt 画布在第一次打开仪表盘时才导入
+            from 仪表盘 import DashboardWindow
+            from 可视化 import ConsoleOutput
+            output_dir = self.output_dir.text()
+            if self.dashboard is None or self.dashboard.output_dir != output_dir:
+                if self.dashboard is not None:
+                    self.dashboard.close()
+                # 在界面线程中直接输出，不经过缓冲定时器
+                self.dashboard = DashboardWindow(output_dir, ConsoleOutput(self.output_area, flush_interval=0))
+            self.dashboard.show()
+            self.dashboard.raise_()
+        except Exception as e:
+            self.append_output(f"打开仪表盘失败：{str(e)}")
+
+    def update_metrics(self, rows):
+        """用本次运行的各阶段汇总填充耗时统计表"""
+        self.metrics_table.setRowCount(len(rows))
+        for row, (stage, count, seconds, records, rate) in enumerate(rows):
+            values = [stage, str(count), f"{seconds:.3f}", str(records or ''), f"{rate:,.0f}" if rate else '']
+            for column, value in enumerate(values):
+                self.metrics_table.setItem(row, column, QTableWidgetItem(value))
+        self.metrics_table.resizeColumnsToContents()
+
+    def update_queue_label(self):
+        self.queue_label.setText(f"排队中: {len(self.pending_jobs)}" if self.pending_jobs else "")
+
+    def on_job_finished(self, success, elapsed_time):
+        if success:
+            self.append_output(f"分类完成，总耗时: {elapsed_time:.2f} 秒")
+        else:
+            self.append_output(f"分类未完成，耗时: {elapsed_time:.2f} 秒")
+        # 仪表盘打开着且显示的是这个输出目录时，加载新结果
+        if success and self.dashboard is not None and self.dashboard.isVisible() \
+                and self.dashboard.output_dir == self.worker.job['output_dir']:
+            self.dashboard.reload()
+        # worker 已返回，线程事件循环退出很快，等待后再开始下一个任务
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+        self.worker = None
+        self.worker_thread = None
+        self.cancel_btn.setEnabled(False)
+        self.start_next_job()
+
 def main():
+    multiprocessing.freeze_support()  # 打包后图表渲染进程池需要
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
+    # 启动性能测试：窗口显示后把时间写入环境变量指定的文件并退出
+    ready_file = os.environ.get('AI_ACCOUNTING_STARTUP_FILE')
+    if ready_file:
+        def report_ready():
+            with open(ready_file, 'w', encoding='utf-8') as f:
+                f.write(repr(time.time()))
+            app.quit()
+        QTimer.singleShot(0, report_ready)
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
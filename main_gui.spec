@@ -19,7 +19,7 @@ a = Analysis(
     runtime_hooks=[],
     excludes = [
         'scipy', 'sqlalchemy', 'tensorflow', 'keras', 'sklearn', 'statsmodels', 'seaborn', 'bokeh', 'plotly', 'django', 'flask',
-        'sqlite3', 'mysql', 'psycopg2', 'pyodbc', 'cx_Oracle', 'pymongo', 'redis', 'pillow', 'opencv', 'pygame', 'pyglet', 'tkinter',
+        'mysql', 'psycopg2', 'pyodbc', 'cx_Oracle', 'pymongo', 'redis', 'pillow', 'opencv', 'pygame', 'pyglet', 'tkinter',
         'tornado', 'gevent', 'twisted', 'zmq', 'paramiko', 'fabric', 'boto3', 'botocore', 'awscli', 'azure', 'google', 'gcloud',
         'xlsxwriter', 'pytz', 'tzdata', 'cryptography', 'pycrypto', 'rsa',
     ]
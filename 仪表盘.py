@@ -0,0 +1,296 @@
+import datetime
+import os
+
+import numpy as np
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+from matplotlib.figure import Figure
+from PyQt5.QtCore import QDate, Qt, QTimer
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QComboBox,
+                             QDateEdit, QFileDialog, QTableWidget, QTableWidgetItem, QSplitter)
+
+from 可视化 import load_records
+from 图表渲染 import BAR_COLORS, chart_context
+from 账本历史 import LedgerHistory, period_label
+from 账目数据 import RecordStore, date_to_days, days_to_date
+
+ALL_CATEGORIES = "全部分类"
+TOP_EXPENSES = 20
+EXPORT_DPI = 300
+
+class DailyAggregates:
+    """按日 × 分类预先汇总的金额和笔数，以及按日期的前缀和
+
+    任意日期范围的分类合计只需两行前缀和相减（与记录数无关）；逐日序列是汇总矩阵的切片；
+    大额消费在按日期排序的记录中二分出日期范围，只在该范围内取前 N 笔。
+    """
+
+    def __init__(self, store):
+        dates, category_codes, name_codes, amounts = store.columns()
+        self.store = store
+        self.categories = list(store.categories)
+        size = len(self.categories)
+        if len(dates):
+            self.first_day, last_day = int(dates.min()), int(dates.max())
+        else:
+            self.first_day, last_day = date_to_days(datetime.date.today()), date_to_days(datetime.date.today()) - 1
+        days = last_day - self.first_day + 1
+
+        cells = (dates - self.first_day).astype(np.int64) * size + category_codes
+        self.daily = np.bincount(cells, weights=amounts, minlength=days * size).reshape(days, size)
+        daily_counts = np.bincount(cells, minlength=days * size).reshape(days, size)
+        self.prefix = np.zeros((days + 1, size))
+        np.cumsum(self.daily, axis=0, out=self.prefix[1:])
+        self.count_prefix = np.zeros((days + 1, size), dtype=np.int64)
+        np.cumsum(daily_counts, axis=0, out=self.count_prefix[1:])
+
+        # 按日期排序的记录下标，用于按日期范围取大额消费
+        self._order = np.argsort(dates, kind='stable')
+        self._sorted_dates = dates[self._order]
+
+    def __len__(self):
+        return len(self.store)
+
+    @property
+    def first_date(self):
+        return days_to_date(self.first_day)
+
+    @property
+    def last_date(self):
+        return days_to_date(self.first_day + len(self.daily) - 1)
+
+    def _rows(self, start, end):
+        """日期范围对应的汇总矩阵行 [i, j)"""
+        i = min(max(date_to_days(start) - self.first_day, 0), len(self.daily))
+        j = min(max(date_to_days(end) - self.first_day + 1, i), len(self.daily))
+        return i, j
+
+    def range_totals(self, start, end):
+        """[start, end] 内各分类的 (金额数组, 笔数数组)，按分类编号排列"""
+        i, j = self._rows(start, end)
+        return self.prefix[j] - self.prefix[i], self.count_prefix[j] - self.count_prefix[i]
+
+    def daily_series(self, start, end, category=None):
+        """[start, end] 内逐日金额，返回 (日期列表, 金额数组)；category 为分类编号，None 表示全部"""
+        i, j = self._rows(start, end)
+        rows = self.daily[i:j]
+        values = rows.sum(axis=1) if category is None else rows[:, category]
+        return [days_to_date(self.first_day + k) for k in range(i, j)], values
+
+    def top_expenses(self, start, end, category=None, n=TOP_EXPENSES):
+        """[start, end] 内（可限定分类）金额最高的 n 条记录下标，降序"""
+        low = np.searchsorted(self._sorted_dates, date_to_days(start), side='left')
+        high = np.searchsorted(self._sorted_dates, date_to_days(end), side='right')
+        indices = self._order[low:high]
+        _, category_codes, _, amounts = self.store.columns()
+        if category is not None:
+            indices = indices[category_codes[indices] == category]
+        if len(indices) > n:
+            indices = indices[np.argpartition(-amounts[indices], n - 1)[:n]]
+        return indices[np.argsort(-amounts[indices], kind='stable')]
+
+def load_dashboard_store(output_dir, console):
+    """优先读取输出目录 history.db 中的全部历史，没有历史时读取 config.txt（或 config.cols）"""
+    history_path = os.path.join(output_dir, "history.db")
+    if os.path.exists(history_path):
+        history = LedgerHistory(history_path)
+        try:
+            store = RecordStore.from_records(history.iter_records())
+        finally:
+            history.close()
+        if len(store):
+            console.log(f"仪表盘已从 {history_path} 加载 {len(store)} 条历史记录")
+            return store
+    config_file = os.path.join(output_dir, "config.txt")
+    if not os.path.exists(config_file):
+        return None
+    return load_records(config_file, console)
+
+class DashboardWindow(QWidget):
+    """消费仪表盘：按日期范围和分类筛选，点击分类柱可下钻，大额消费列在下方表格
+
+    筛选变化只重新计算受影响的部分：日期范围变化时重算分类合计（前缀和相减），
+    只切换分类时分类图仅改变高亮。图表按屏幕分辨率绘制，PNG 只在点击“导出”时按 300 dpi 生成。
+    """
+
+    def __init__(self, output_dir, console, parent=None):
+        super().__init__(parent)
+        self.output_dir = output_dir
+        self.console = console
+        self.data = None
+        self._category_bars = []
+        self._bar_codes = []
+        self._drawn_range = None
+        self.setWindowTitle("消费仪表盘")
+        self.resize(1000, 760)
+
+        layout = QVBoxLayout(self)
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("开始:"))
+        self.start_edit = QDateEdit()
+        self.start_edit.setCalendarPopup(True)
+        self.start_edit.setDisplayFormat("yyyy-MM-dd")
+        filter_layout.addWidget(self.start_edit)
+        filter_layout.addWidget(QLabel("结束:"))
+        self.end_edit = QDateEdit()
+        self.end_edit.setCalendarPopup(True)
+        self.end_edit.setDisplayFormat("yyyy-MM-dd")
+        filter_layout.addWidget(self.end_edit)
+        filter_layout.addWidget(QLabel("分类:"))
+        self.category_combo = QComboBox()
+        filter_layout.addWidget(self.category_combo)
+        all_btn = QPushButton("全部日期")
+        all_btn.clicked.connect(self.reset_range)
+        filter_layout.addWidget(all_btn)
+        filter_layout.addStretch()
+        reload_btn = QPushButton("重新加载")
+        reload_btn.clicked.connect(self.reload)
+        filter_layout.addWidget(reload_btn)
+        export_btn = QPushButton("导出PNG")
+        export_btn.clicked.connect(self.export_png)
+        filter_layout.addWidget(export_btn)
+        layout.addLayout(filter_layout)
+
+        self.summary_label = QLabel("")
+        layout.addWidget(self.summary_label)
+
+        splitter = QSplitter(Qt.Vertical)
+        self.figure = Figure(figsize=(10, 6))
+        self.canvas = FigureCanvasQTAgg(self.figure)
+        self.canvas.mpl_connect('pick_event', self.on_pick)
+        splitter.addWidget(self.canvas)
+        self.expense_table = QTableWidget(0, 4)
+        self.expense_table.setHorizontalHeaderLabels(["日期", "分类", "名称", "金额(元)"])
+        self.expense_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        splitter.addWidget(self.expense_table)
+        splitter.setSizes([520, 200])
+        layout.addWidget(splitter)
+
+        with chart_context():
+            self.category_ax = self.figure.add_subplot(2, 1, 1)
+            self.daily_ax = self.figure.add_subplot(2, 1, 2)
+
+        # 连续修改筛选条件时合并为一次重绘
+        self._redraw_timer = QTimer(self)
+        self._redraw_timer.setSingleShot(True)
+        self._redraw_timer.setInterval(120)
+        self._redraw_timer.timeout.connect(self.redraw)
+        self.start_edit.dateChanged.connect(self._redraw_timer.start)
+        self.end_edit.dateChanged.connect(self._redraw_timer.start)
+        self.category_combo.currentIndexChanged.connect(self._redraw_timer.start)
+
+        self.reload()
+
+    def reload(self):
+        """重新加载数据并重建汇总"""
+        store = load_dashboard_store(self.output_dir, self.console)
+        if store is None or not len(store):
+            self.data = None
+            self.summary_label.setText(f"{self.output_dir} 中没有可显示的记录")
+            return
+        self.data = DailyAggregates(store)
+        self._drawn_range = None
+        for widget in (self.start_edit, self.end_edit, self.category_combo):
+            widget.blockSignals(True)
+        first, last = self.data.first_date, self.data.last_date
+        for edit in (self.start_edit, self.end_edit):
+            edit.setDateRange(QDate(first.year, first.month, first.day), QDate(last.year, last.month, last.day))
+        self.start_edit.setDate(QDate(first.year, first.month, first.day))
+        self.end_edit.setDate(QDate(last.year, last.month, last.day))
+        self.category_combo.clear()
+        self.category_combo.addItem(ALL_CATEGORIES)
+        self.category_combo.addItems(self.data.categories)
+        for widget in (self.start_edit, self.end_edit, self.category_combo):
+            widget.blockSignals(False)
+        self.redraw()
+
+    def reset_range(self):
+        if self.data is not None:
+            self.start_edit.setDate(self.start_edit.minimumDate())
+            self.end_edit.setDate(self.end_edit.maximumDate())
+
+    def selected_range(self):
+        start = self.start_edit.date().toPyDate()
+        end = self.end_edit.date().toPyDate()
+        return (start, end) if start <= end else (end, start)
+
+    def selected_category(self):
+        """当前选中的分类编号，全部分类时为 None"""
+        index = self.category_combo.currentIndex()
+        return index - 1 if index > 0 else None
+
+    def redraw(self):
+        if self.data is None:
+            return
+        start, end = self.selected_range()
+        category = self.selected_category()
+        with chart_context():
+            if self._drawn_range != (start, end):
+                self._draw_categories(start, end)
+                self._drawn_range = (start, end)
+            self._highlight_category(category)
+            self._draw_daily(start, end, category)
+        self.canvas.draw_idle()
+        self._fill_expenses(start, end, category)
+
+    def _draw_categories(self, start, end):
+        totals, counts = self.data.range_totals(start, end)
+        codes = [code for code in np.argsort(-totals, kind='stable') if counts[code]]
+        ax = self.category_ax
+        ax.clear()
+        labels = [self.data.categories[code] for code in codes]
+        values = [totals[code] for code in codes]
+        self._category_bars = list(ax.barh(range(len(codes)), values, color=BAR_COLORS[0], picker=True))
+        self._bar_codes = codes
+        ax.set_yticks(range(len(codes)))
+        ax.set_yticklabels(labels)
+        ax.invert_yaxis()
+        ax.set_xlabel('金额 (元)')
+        ax.set_title(f"{period_label(start, end)} 分类消费（点击分类查看明细）")
+        total = float(totals.sum())
+        self.summary_label.setText(f"{period_label(start, end)}：共 {int(counts.sum())} 笔，{total:.2f} 元")
+
+    def _highlight_category(self, category):
+        for bar, code in zip(self._category_bars, self._bar_codes):
+            selected = category is None or code == category
+            bar.set_color(BAR_COLORS[0] if selected else '#c7c7c7')
+
+    def _draw_daily(self, start, end, category):
+        dates, values = self.data.daily_series(start, end, category)
+        ax = self.daily_ax
+        ax.clear()
+        if dates:
+            ax.bar(dates, values, width=1.0, color=BAR_COLORS[1])
+        name = ALL_CATEGORIES if category is None else self.data.categories[category]
+        ax.set_title(f"每日消费 - {name}")
+        ax.set_ylabel('金额 (元)')
+        self.figure.autofmt_xdate()
+        self.figure.tight_layout()
+
+    def _fill_expenses(self, start, end, category):
+        indices = self.data.top_expenses(start, end, category)
+        self.expense_table.setRowCount(len(indices))
+        for row, index in enumerate(indices):
+            date, category_name, name, amount = self.data.store.record(index)
+            for column, value in enumerate([date.isoformat(), category_name, name, f"{amount:.2f}"]):
+                self.expense_table.setItem(row, column, QTableWidgetItem(value))
+        self.expense_table.resizeColumnsToContents()
+
+    def on_pick(self, event):
+        """点击分类柱：下钻到该分类；再次点击回到全部分类"""
+        if event.artist not in self._category_bars:
+            return
+        code = self._bar_codes[self._category_bars.index(event.artist)]
+        index = 0 if self.selected_category() == code else code + 1
+        self.category_combo.setCurrentIndex(index)
+
+    def export_png(self):
+        """按 300 dpi 导出当前视图"""
+        if self.data is None:
+            return
+        default_path = os.path.join(self.output_dir, "仪表盘.png")
+        path, _ = QFileDialog.getSaveFileName(self, "导出图表", default_path, "PNG 图片 (*.png)")
+        if not path:
+            return
+        with chart_context():
+            self.figure.savefig(path, dpi=EXPORT_DPI, bbox_inches='tight')
+        self.console.log(f"仪表盘已导出为: {path}")
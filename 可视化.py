@@ -1,203 +1,242 @@
-import matplotlib.pyplot as plt
-from matplotlib.font_manager import FontProperties
-import platform
 import os
+import threading
+import time
+
+from 账目数据 import RecordStore, columns_path, days_to_date, file_signature
+from 记录解析 import iter_records
+from 账本历史 import period_label
+from 性能指标 import MetricsRecorder
+from 大额消费 import LargeExpenseTracker
+
+# 日志级别，与 logging 模块的数值一致
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+# 缓冲的日志行数达到该值时立即刷新，不等定时器
+MAX_PENDING_LINES = 1000
+# 日志文件超过该大小时改名为 run.log.1（只保留一个旧文件），再写入新文件
+LOG_MAX_BYTES = 5 * 1024 * 1024
 
 class ConsoleOutput:
-    def __init__(self, output_widget):
+    """带缓冲的日志输出
+
+    消息先放进缓冲区，最多每 flush_interval 秒合并成一次 append 写到界面（同时打印到控制台），
+    日志再多也不会逐行刷新界面。低于 level 的消息（如逐条记录的明细）不显示，
+    但仍写入 log_file（不低于 file_level 的部分），同样定时刷新；log_file 超过 max_bytes 时轮换。
+    """
+
+    def __init__(self, output_widget, level=INFO, log_file=None, file_level=DEBUG, flush_interval=1 / 30,
+                 max_bytes=LOG_MAX_BYTES):
         self.output_widget = output_widget
-        
-    def log(self, message):
-        if self.output_widget is not None:
-            self.output_widget.append(message)
-        print(message)  # 同时输出到控制台
-
-def get_system_font():
-    """根据操作系统返回合适的字体设置"""
-    system = platform.system()
-    
-    if system == 'Windows':
-        font_list = ['Microsoft YaHei', 'SimHei', 'SimSun']
-        for font in font_list:
-            try:
-                FontProperties(fname=font)
-                return font
-            except:
-                continue
-    elif system == 'Darwin':  # macOS
-        font_paths = [
-            '/System/Library/Fonts/PingFang.ttc',
-            '/System/Library/Fonts/STHeiti Light.ttc',
-            '/System/Library/Fonts/STHeiti Medium.ttc'
-        ]
-        for path in font_paths:
-            if os.path.exists(path):
-                return path
-    
-    return 'sans-serif'
-
-def setup_matplotlib_fonts():
-    """设置matplotlib的字体和负号显示"""
-    font = get_system_font()
-    
-    if platform.system() == 'Windows':
-        plt.rcParams['font.sans-serif'] = [font]
-    else:  # macOS
-        if font != 'sans-serif':
-            plt.rcParams['font.sans-serif'] = ['Arial Unicode MS']
-            try:
-                FontProperties(fname=font)
-            except:
-                plt.rcParams['font.sans-serif'] = ['Arial Unicode MS']
-    
-    plt.rcParams['axes.unicode_minus'] = False
+        self.level = level
+        self.log_file = log_file
+        self.file_level = file_level
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # 写界面和控制台时持有，保证各线程刷新出的批次按取出缓冲的顺序输出
+        self._output_lock = threading.Lock()
+        self._pending = []
+        self._pending_file = []
+        self._timer = None
+        self._file = None
+        self._last_flush = 0.0
+
+    def log(self, message, level=INFO):
+        message = str(message)
+        with self._lock:
+            if self.log_file is not None and level >= self.file_level:
+                self._pending_file.append(
+                    f"{time.strftime('%Y-%m-%d %H:%M:%S')} {LEVEL_NAMES.get(level, level)} {message}")
+            if level >= self.level:
+                self._pending.append(message)
+            elif not self._pending_file:
+                return
+            # 距离上次刷新已超过间隔或缓冲过多时立即刷新，否则安排一次定时刷新
+            buffered = len(self._pending) + len(self._pending_file)
+            if time.monotonic() - self._last_flush < self.flush_interval and buffered < MAX_PENDING_LINES:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.flush_interval, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        """把缓冲的消息一次写出
+
+        取出缓冲后先拿到 _output_lock 再释放 _lock：输出期间其他线程仍可继续写日志，
+        但后取出的批次要等前一批写完才能输出，定时器线程和记录日志的线程不会交错乱序。
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending = self._pending, []
+            pending_file, self._pending_file = self._pending_file, []
+            self._last_flush = time.monotonic()
+            if pending_file:
+                try:
+                    self._write_file("\n".join(pending_file) + "\n")
+                except OSError:
+                    pass
+            self._output_lock.acquire()
+        try:
+            if pending:
+                text = "\n".join(pending)
+                if self.output_widget is not None:
+                    self.output_widget.append(text)
+                print(text)  # 同时输出到控制台
+        finally:
+            self._output_lock.release()
+
+    def _write_file(self, text):
+        """追加写入日志文件，文件超过 max_bytes 时先轮换；调用时持有 _lock"""
+        if self._file is not None and os.fstat(self._file.fileno()).st_size >= self.max_bytes:
+            self._file.close()
+            self._file = None
+        if self._file is None:
+            if os.path.exists(self.log_file) and os.path.getsize(self.log_file) >= self.max_bytes:
+                os.replace(self.log_file, self.log_file + '.1')
+            self._file = open(self.log_file, 'a', encoding='utf-8')
+        self._file.write(text)
+        self._file.flush()
+
+    def close(self):
+        """刷新缓冲并关闭日志文件；之后再写日志会重新打开"""
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
 
 def parse_config_file(file_path, console):
-    # 初始化空字典
-    expenses = {}
-    large_expenses = []
-    
+    """解析 config.txt，返回按列存储的 RecordStore；读取失败时返回 None"""
+    store = RecordStore()
+    errors = []
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        for record in iter_records(file_path, errors):
+            store.append(record.date, record.category, record.name, record.amount, record.description)
     except Exception as e:
         console.log(f"读取配置文件失败: {str(e)}")
-        return None, None
-        
-    is_reading = False
-    for line in lines:
-        line = line.strip()
-        if line == '# start':
-            is_reading = True
-            continue
-        elif line == '# end':
-            break
-        
-        if is_reading and line:
-            try:
-                parts = line.split(' ')
-                date = parts[0].split(':')[1]
-                type_name = parts[1].split(':')[1]
-                name = parts[2].split(':')[1]
-                cost = float(parts[3].split(':')[1])
-                
-                # 动态添加分类
-                if type_name not in expenses:
-                    expenses[type_name] = []
-                
-                expense_detail = {
-                    'date': date,
-                    'name': name,
-                    'amount': cost,
-                    'description': ' '.join(parts[4:]) if len(parts) > 4 else '无描述'
-                }
-                
-                expenses[type_name].append(expense_detail)
-                
-                if cost >= 30:
-                    large_expenses.append({
-                        "date": date.replace('-', '月') + '日',
-                        "name": name,
-                        "amount": cost,
-                        "description": expense_detail['description']
-                    })
-            except Exception as e:
-                console.log(f"解析行 '{line}' 失败: {str(e)}")
-                continue
-    
-    return expenses, large_expenses
-
-def create_visualizations(config_file, console, output_dir):
-    """创建可视化图表"""
+        return None
+
+    for rejected in errors:
+        console.log(f"解析第 {rejected.line_no} 行失败（{rejected.reason}）: '{rejected.line}'", WARNING)
+    return store
+
+def load_records(config_file, console, metrics=None):
+    """优先从 config.cols 列式存储加载记录，不存在或已过期时解析 config.txt 并重新生成"""
+    metrics = metrics or MetricsRecorder()
+    path = columns_path(config_file)
     try:
-        # 设置字体
-        setup_matplotlib_fonts()
-        
-        # 解析配置文件
-        expenses, large_expenses = parse_config_file(config_file, console)
-        if expenses is None:
+        signature = file_signature(config_file)
+    except OSError as e:
+        console.log(f"读取配置文件失败: {str(e)}")
+        return None
+    try:
+        with metrics.span('load_columns') as span:
+            store = RecordStore.load(path, signature)
+            span['records'] = len(store) if store is not None else 0
+    except Exception as e:
+        console.log(f"读取列式数据失败，改为解析文本: {str(e)}")
+        store = None
+    if store is not None:
+        console.log(f"已从 {path} 加载 {len(store)} 条记录")
+        return store
+
+    with metrics.span('parse_config_file') as span:
+        store = parse_config_file(config_file, console)
+        span['records'] = len(store) if store is not None else 0
+    if store is not None:
+        try:
+            store.save(path, signature)
+        except Exception as e:
+            console.log(f"保存列式数据失败: {str(e)}")
+    return store
+
+def create_visualizations(config_file, console, output_dir, metrics=None, render=True, tracker=None):
+    """创建可视化图表，metrics 为 性能指标.MetricsRecorder，记录加载和各图表渲染的耗时
+
+    render 为 False 时只输出分类统计，不生成 PNG（界面中改用仪表盘查看，需要时再导出）。
+    tracker 为 大额消费.LargeExpenseTracker（可带历史分布和分类阈值），默认阈值 30 元。
+    """
+    metrics = metrics or MetricsRecorder()
+    tracker = tracker or LargeExpenseTracker()
+    try:
+        # 加载记录（列式存储或解析配置文件）
+        store = load_records(config_file, console, metrics)
+        if store is None:
+            return
+        if not len(store):
+            console.log("没有可用于可视化的记录")
             return
             
         # 打印分类详情
+        totals, counts = store.category_totals()
+        dates, _, name_codes, amounts = store.columns()
         console.log("\n=== 详细分类消费记录 ===")
-        for category, records in expenses.items():
-            if records:
-                console.log(f"\n分类: {category}")
-                console.log(f"总金额: {sum(r['amount'] for r in records):.2f}元")
-                console.log(f"交易次数: {len(records)}")
-                console.log("具体消费记录:")
-                for record in records:
-                    console.log(f"  - 日期: {record['date']}")
-                    console.log(f"    项目: {record['name']}")
-                    console.log(f"    金额: {record['amount']:.2f}元")
-                    console.log(f"    描述: {record['description']}")
-                    console.log("    -------------------")
+        for code, indices in store.group_by_category():
+            console.log(f"\n分类: {store.categories[code]}")
+            console.log(f"总金额: {totals[code]:.2f}元")
+            console.log(f"交易次数: {counts[code]}")
+            console.log("具体消费记录:", DEBUG)
+            for i in indices:
+                # 逐条明细只写入日志文件，界面默认不显示
+                console.log(f"  - 日期: {days_to_date(dates[i])}\n"
+                            f"    项目: {store.names[name_codes[i]]}\n"
+                            f"    金额: {amounts[i]:.2f}元\n"
+                            f"    描述: {store.description(i) or '无描述'}\n"
+                            "    -------------------", DEBUG)
         console.log("\n=== 分类详情结束 ===")
         
-        # 计算每个类别的总金额和百分比
-        categories = list(expenses.keys())
-        expenses_totals = [sum(r['amount'] for r in records) for records in expenses.values()]
-        total_expense = sum(expenses_totals)
-        
-        # 计算每个类别的百分比
-        percentages = [(amount / total_expense) * 100 for amount in expenses_totals]
-        
-        # 设置阈值（比如3%）
+        # 计算每个类别的总金额，占比小于阈值（3%）的类别合并为"其他"
         THRESHOLD = 3
-        
-        # 将小于阈值的类别合并为"其他"
-        other_mask = [p < THRESHOLD for p in percentages]
-        if any(other_mask):
-            other_total = sum(amount for amount, is_small in zip(expenses_totals, other_mask) if is_small)
-            new_categories = [cat for cat, is_small in zip(categories, other_mask) if not is_small] + ['其他']
-            new_expenses = [amount for amount, is_small in zip(expenses_totals, other_mask) if not is_small] + [other_total]
+        new_categories, new_expenses, total_expense = store.category_summary(THRESHOLD)
+        label = period_label(days_to_date(dates.min()), days_to_date(dates.max()))
+
+        # 饼图
+        charts = [('月度消费统计.png', {
+            'kind': 'pie',
+            'labels': list(new_categories),
+            'values': [float(value) for value in new_expenses],
+            'total': total_expense,
+            'title': f'{label}消费统计',
+        })]
+
+        # 大额消费（达到各分类阈值）和异常消费（相对该分类历史中位数）
+        with metrics.span('large_expenses', records=len(store)):
+            tracker.add_store(store)
+        outliers = tracker.outliers(n=10)
+        if outliers:
+            console.log("\n=== 异常消费 ===")
+            for expense in outliers:
+                console.log(f"{expense.date} {expense.category} {expense.name} {expense.amount:.2f}元"
+                            f"（稳健 z 分数 {expense.score:.1f}）")
+
+        # 最大5笔消费柱状图（只统计达到大额阈值的消费）
+        top = tracker.top(5)
+        if top:
+            charts.append(('月度5笔最高消费.png', {
+                'kind': 'bar',
+                'labels': [f"{e.date.month:02d}月{e.date.day:02d}日\n{e.name}" for e in top],
+                'values': [float(e.amount) for e in top],
+                'title': f'{label}消费最高的前五笔内容',
+            }))
         else:
-            new_categories = categories
-            new_expenses = expenses_totals
-
-        # 绘制饼图
-        plt.figure(figsize=(10, 8))
-        start_angle = 90
-        plt.pie(
-            new_expenses,
-            labels=new_categories,
-            autopct=lambda pct: f'{pct:.1f}%\n({pct/100.*total_expense:.2f}元)',
-            startangle=start_angle
-        )
-        plt.title('月度消费统计', fontsize=16, pad=20)
-        plt.text(-1.5, -1.2, f"总计: {total_expense:.2f}元", fontsize=12)
-        # 保存饼图
-        output_pie = os.path.join(output_dir, '月度消费统计.png')
-        plt.savefig(output_pie, dpi=300, bbox_inches='tight')
-        plt.close()
-        console.log(f"饼图已保存为: {output_pie}")
-
-        # 绘制最大5笔消费柱状图
-        consumptions = sorted(large_expenses, key=lambda x: x['amount'], reverse=True)[:5]
-        labels = [f"{item['date']}\n{item['name']}" for item in consumptions]
-        values = [item['amount'] for item in consumptions]
-        bar_colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd']
-
-        plt.figure(figsize=(12, 6))
-        bars = plt.bar(range(len(values)), values, color=bar_colors)
-        plt.xticks(range(len(labels)), labels, rotation=0)
-        plt.ylabel('金额 (元)')
-        plt.title('月度消费最高的前五笔内容', pad=20)
-
-        for bar in bars:
-            height = bar.get_height()
-            plt.text(bar.get_x() + bar.get_width()/2., height,
-                    f'{height:.2f}元',
-                    ha='center', va='bottom')
-
-        max_value = max(values)
-        plt.ylim(0, max_value * 1.15)
-        plt.tight_layout()
-        # 保存柱状图
-        output_bar = os.path.join(output_dir, '月度5笔最高消费.png')
-        plt.savefig(output_bar, format='png', bbox_inches='tight', dpi=300)
-        plt.close()
-        console.log(f"柱状图已保存为: {output_bar}")
+            console.log("没有达到大额阈值的消费，跳过柱状图")
+
+        if not render:
+            return
+
+        # matplotlib 只在真正生成图表时导入
+        from 图表渲染 import render_charts
+        timings = render_charts(charts, output_dir, console)
+        for file_name, elapsed in timings.items():
+            metrics.record('render_chart', seconds=elapsed, chart=file_name, skipped=elapsed is None)
 
     except Exception as e:
-        console.log(f"可视化过程出错: {str(e)}")
\ No newline at end of file
+        console.log(f"可视化过程出错: {str(e)}")
@@ -0,0 +1,182 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+import atexit
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import threading
+import time
+
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.font_manager import FontProperties
+
+# 记录各图表上次渲染时输入数据的哈希，数据没变就不重新渲染
+CHART_CACHE_FILE = '.chart_cache.json'
+BAR_COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd']
+# 启动 spawn 进程池（每个进程重新导入 matplotlib）约需 1.5 秒，而一张图只需 0.3 秒左右；
+# 进程池未启动时，待渲染的图表达到该数量才使用进程池
+PARALLEL_MIN_CHARTS = 6
+
+_render_pool = None
+# rc_context 修改的是全局 rcParams：同一进程中的画图（多个任务线程渲染、界面仪表盘）依次进行，互不覆盖字体设置
+_rc_lock = threading.RLock()
+
+@lru_cache(maxsize=None)
+def get_system_font():
+    """根据操作系统返回合适的字体设置，结果在进程内缓存"""
+    system = platform.system()
+
+    if system == 'Windows':
+        font_list = ['Microsoft YaHei', 'SimHei', 'SimSun']
+        for font in font_list:
+            try:
+                FontProperties(fname=font)
+                return font
+            except:
+                continue
+    elif system == 'Darwin':  # macOS
+        font_paths = [
+            '/System/Library/Fonts/PingFang.ttc',
+            '/System/Library/Fonts/STHeiti Light.ttc',
+            '/System/Library/Fonts/STHeiti Medium.ttc'
+        ]
+        for path in font_paths:
+            if os.path.exists(path):
+                return path
+
+    return 'sans-serif'
+
+@lru_cache(maxsize=None)
+def _font_settings():
+    font = get_system_font()
+    settings = {'axes.unicode_minus': False}
+    if platform.system() == 'Windows':
+        settings['font.sans-serif'] = [font]
+    elif font != 'sans-serif':  # macOS
+        settings['font.sans-serif'] = ['Arial Unicode MS']
+    return settings
+
+def font_settings():
+    """图表使用的 rcParams（字体和负号显示），通过 chart_context 应用"""
+    return dict(_font_settings())
+
+@contextmanager
+def chart_context(settings=None):
+    """持有画图锁并临时应用 settings（默认 font_settings()），退出后恢复原来的 rcParams"""
+    with _rc_lock, matplotlib.rc_context(settings or font_settings()):
+        yield
+
+def _draw_pie(figure, spec):
+    ax = figure.add_subplot()
+    total = spec['total']
+    ax.pie(
+        spec['values'],
+        labels=spec['labels'],
+        autopct=lambda pct: f'{pct:.1f}%\n({pct/100.*total:.2f}元)',
+        startangle=90
+    )
+    ax.set_title(spec['title'], fontsize=16, pad=20)
+    ax.text(-1.5, -1.2, f"总计: {total:.2f}元", fontsize=12)
+
+def _draw_bar(figure, spec):
+    ax = figure.add_subplot()
+    values = spec['values']
+    bars = ax.bar(range(len(values)), values, color=BAR_COLORS[:len(values)])
+    ax.set_xticks(range(len(spec['labels'])))
+    ax.set_xticklabels(spec['labels'], rotation=0)
+    ax.set_ylabel('金额 (元)')
+    ax.set_title(spec['title'], pad=20)
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width()/2., height,
+                f'{height:.2f}元',
+                ha='center', va='bottom')
+    ax.set_ylim(0, max(values) * 1.15)
+    figure.tight_layout()
+
+FIGURE_SIZES = {'pie': (10, 8), 'bar': (12, 6)}
+DRAWERS = {'pie': _draw_pie, 'bar': _draw_bar}
+
+def render_chart(spec, output_path, settings, dpi=300):
+    """按 spec 渲染一张图表并保存，返回耗时（秒）
+
+    只使用 Figure 对象，不经过 pyplot，可以在多个进程中并行调用；
+    同一进程内多个线程调用时在 chart_context 的锁内依次渲染。
+    """
+    with chart_context(settings):
+        start = time.perf_counter()
+        figure = Figure(figsize=FIGURE_SIZES[spec['kind']])
+        FigureCanvasAgg(figure)
+        DRAWERS[spec['kind']](figure, spec)
+        figure.savefig(output_path, dpi=dpi, bbox_inches='tight')
+        return time.perf_counter() - start
+
+def chart_hash(spec, settings, dpi):
+    payload = json.dumps([spec, settings, dpi], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _get_render_pool():
+    """跨运行复用的渲染进程池；使用 spawn，避免从带线程的 GUI 进程 fork"""
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn'))
+        atexit.register(_render_pool.shutdown)
+    return _render_pool
+
+def _load_chart_cache(output_dir):
+    try:
+        with open(os.path.join(output_dir, CHART_CACHE_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_chart_cache(output_dir, cache):
+    try:
+        with open(os.path.join(output_dir, CHART_CACHE_FILE), 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+    except OSError:
+        pass
+
+def render_charts(charts, output_dir, console, dpi=300, parallel=True):
+    """渲染一组图表，charts 为 [(文件名, spec)]
+
+    输入数据哈希与上次相同且文件仍存在的图表直接跳过；其余图表默认逐个渲染，
+    进程池已经启动或图表不少于 PARALLEL_MIN_CHARTS 张时才并行渲染，进程池不可用时改为逐个渲染。
+    返回 {文件名: 耗时或 None（跳过）}。
+    """
+    settings = font_settings()
+    cache = _load_chart_cache(output_dir)
+    timings = {}
+    pending = []
+    for file_name, spec in charts:
+        output_path = os.path.join(output_dir, file_name)
+        digest = chart_hash(spec, settings, dpi)
+        if cache.get(file_name) == digest and os.path.exists(output_path):
+            console.log(f"图表数据未变化，跳过渲染: {output_path}")
+            timings[file_name] = None
+            continue
+        pending.append((file_name, spec, output_path, digest))
+
+    use_pool = _render_pool is not None or len(pending) >= PARALLEL_MIN_CHARTS
+    if parallel and use_pool and len(pending) > 1:
+        try:
+            pool = _get_render_pool()
+            futures = [pool.submit(render_chart, spec, path, settings, dpi) for _, spec, path, _ in pending]
+            results = [future.result() for future in futures]
+        except Exception as e:
+            console.log(f"并行渲染失败，改为逐个渲染: {str(e)}")
+            results = [render_chart(spec, path, settings, dpi) for _, spec, path, _ in pending]
+    else:
+        results = [render_chart(spec, path, settings, dpi) for _, spec, path, _ in pending]
+
+    for (file_name, _, output_path, digest), elapsed in zip(pending, results):
+        cache[file_name] = digest
+        timings[file_name] = elapsed
+        console.log(f"图表已保存为: {output_path}（{elapsed:.2f} 秒）")
+    _save_chart_cache(output_dir, cache)
+    return timings
@@ -0,0 +1,251 @@
+from array import array
+from collections import Counter, namedtuple
+import heapq
+import re
+
+import numpy as np
+
+from 账目数据 import days_to_date
+
+DEFAULT_THRESHOLD = 30.0
+# 稳健 z 分数 = (金额 - 中位数) / (1.4826 × MAD)，超过 MAD_FACTOR 视为异常
+MAD_SCALE = 1.4826
+MAD_FACTOR = 3.5
+# 样本少于该数量的分类不做异常判断
+MIN_SAMPLES = 8
+# 样本数比上次计算时增长 25% 后重新计算中位数和 MAD
+REFIT_GROWTH = 1.25
+
+LargeExpense = namedtuple('LargeExpense', ['date', 'category', 'name', 'amount', 'score'])
+
+THRESHOLD_ITEM = re.compile(r'^(?:(.+?)[=:：])?(\d+(?:\.\d+)?)$')
+
+def parse_thresholds(text, default=DEFAULT_THRESHOLD):
+    """解析大额阈值设置，如 "30, 住房=3000, 医疗=500"：单独的数字为默认阈值
+
+    返回 (默认阈值, {分类: 阈值})；格式不对的项抛出 ValueError。
+    """
+    thresholds = {}
+    for item in re.split(r'[,，;；\s]+', text or ''):
+        if not item:
+            continue
+        match = THRESHOLD_ITEM.match(item)
+        if match is None:
+            raise ValueError(f"无法识别的阈值设置: {item}")
+        category, value = match.groups()
+        if category:
+            thresholds[category.strip()] = float(value)
+        else:
+            default = float(value)
+    return default, thresholds
+
+def period_of(date):
+    return f"{date.year}-{date.month:02d}"
+
+class LargeExpenseTracker:
+    """大额消费跟踪
+
+    - 全部、每个分类、每个月各保留金额最高的 k 笔（达到该分类阈值的消费），用大小为 k 的最小堆维护，
+      处理 n 条记录为 O(n log k)
+    - 每个分类的阈值可单独设置，未设置的使用默认阈值
+    - 按分类的中位数和 MAD（可先用历史记录 fit）识别异常消费，每个分类保留稳健 z 分数最高的 k 笔
+    add 逐条更新，适合流式输出；add_store 用 NumPy 批量处理整个 RecordStore。
+    """
+
+    def __init__(self, k=10, default_threshold=DEFAULT_THRESHOLD, thresholds=None,
+                 mad_factor=MAD_FACTOR, min_samples=MIN_SAMPLES):
+        self.k = k
+        self.default_threshold = default_threshold
+        self.thresholds = dict(thresholds or {})
+        self.mad_factor = mad_factor
+        self.min_samples = min_samples
+        self.threshold_counts = Counter()
+        self._seq = 0
+        self._top = []
+        self._by_category = {}
+        self._by_period = {}
+        self._outliers = {}
+        self._samples = {}
+        self._stats = {}
+
+    @classmethod
+    def from_settings(cls, text, **kwargs):
+        """由 parse_thresholds 格式的设置创建"""
+        default, thresholds = parse_thresholds(text)
+        return cls(default_threshold=default, thresholds=thresholds, **kwargs)
+
+    def threshold_for(self, category):
+        return self.thresholds.get(category, self.default_threshold)
+
+    def _push(self, heap, key, expense):
+        """堆中保留 key 最大的 k 项；key 相同时先出现的优先"""
+        item = (key, -self._seq, expense)
+        self._seq += 1
+        if len(heap) < self.k:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    def _add_samples(self, category, amounts):
+        samples = self._samples.get(category)
+        if samples is None:
+            samples = self._samples[category] = array('d')
+        samples.extend(amounts)
+
+    def fit(self, records):
+        """用历史记录（记录解析.Record 序列）建立各分类的金额分布，不计入大额列表"""
+        grouped = {}
+        for record in records:
+            grouped.setdefault(record.category, []).append(record.amount)
+        for category, amounts in grouped.items():
+            self._add_samples(category, amounts)
+        self._stats.clear()
+
+    def stats(self, category):
+        """分类的 (中位数, MAD)，样本不足时返回 None；样本增长超过 25% 时才重新计算"""
+        samples = self._samples.get(category)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        cached = self._stats.get(category)
+        if cached is None or len(samples) >= cached[2] * REFIT_GROWTH:
+            values = np.frombuffer(samples, dtype=np.float64)
+            median = float(np.median(values))
+            mad = float(np.median(np.abs(values - median)))
+            cached = self._stats[category] = (median, mad, len(samples))
+        return cached[0], cached[1]
+
+    def score(self, category, amount):
+        """稳健 z 分数；样本不足或 MAD 为 0 时返回 None"""
+        stats = self.stats(category)
+        if stats is None or stats[1] == 0:
+            return None
+        median, mad = stats
+        return (amount - median) / (MAD_SCALE * mad)
+
+    def add(self, date, category, name, amount):
+        """加入一条记录；达到阈值或判为异常时返回 LargeExpense，否则返回 None"""
+        self._add_samples(category, (amount,))
+        score = self.score(category, amount)
+        expense = LargeExpense(date, category, name, amount, score)
+        flagged = False
+        if amount >= self.threshold_for(category):
+            self.threshold_counts[category] += 1
+            self._push(self._top, amount, expense)
+            self._push(self._by_category.setdefault(category, []), amount, expense)
+            self._push(self._by_period.setdefault(period_of(date), []), amount, expense)
+            flagged = True
+        if score is not None and score >= self.mad_factor:
+            self._push(self._outliers.setdefault(category, []), score, expense)
+            flagged = True
+        return expense if flagged else None
+
+    def remove(self, date, category, name, amount):
+        """撤回一条用 add 加入的记录（如流式分块失败、重试前撤回）
+
+        被这条记录挤出前 k 笔的消费不会恢复。
+        """
+        samples = self._samples.get(category)
+        if samples is not None:
+            try:
+                samples.remove(amount)
+            except ValueError:
+                pass
+        if amount >= self.threshold_for(category) and self.threshold_counts[category] > 0:
+            self.threshold_counts[category] -= 1
+        values = (date, category, name, amount)
+        for heap in (self._top, self._by_category.get(category), self._by_period.get(period_of(date)),
+                     self._outliers.get(category)):
+            if not heap:
+                continue
+            for i, (_, _, expense) in enumerate(heap):
+                if expense[:4] == values:
+                    heap[i] = heap[-1]
+                    heap.pop()
+                    heapq.heapify(heap)
+                    break
+
+    def add_store(self, store):
+        """批量加入 RecordStore 中的全部记录
+
+        每个分类、每个月先用 argpartition 选出前 k 笔再放入堆，整体为 O(n)；
+        异常判断使用包含本批数据在内的分布。
+        """
+        dates, category_codes, name_codes, amounts = store.columns()
+        if not len(amounts):
+            return
+        months = dates.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+        def expense(index, score=None):
+            date, category, name, amount = store.record(index)
+            return LargeExpense(date, category, name, amount, score)
+
+        def top_indices(indices, keys):
+            # indices 为升序；第 k 大的值有并列时只取先出现的，与逐条 add 的结果一致
+            if len(indices) > self.k:
+                kth = keys[np.argpartition(-keys, self.k - 1)[self.k - 1]]
+                above = keys > kth
+                ties = np.flatnonzero(keys == kth)[:self.k - int(above.sum())]
+                above[ties] = True
+                indices, keys = indices[above], keys[above]
+            return indices, keys
+
+        for code, indices in store.group_by_category():
+            category = store.categories[code]
+            values = amounts[indices]
+            self._add_samples(category, values.tolist())
+
+            large = indices[values >= self.threshold_for(category)]
+            self.threshold_counts[category] += len(large)
+            for index, amount in zip(*top_indices(large, amounts[large])):
+                item = expense(index)
+                self._push(self._top, float(amount), item)
+                self._push(self._by_category.setdefault(category, []), float(amount), item)
+
+            stats = self.stats(category)
+            if stats is not None and stats[1] > 0:
+                scores = (values - stats[0]) / (MAD_SCALE * stats[1])
+                flagged = scores >= self.mad_factor
+                for index, score in zip(*top_indices(indices[flagged], scores[flagged])):
+                    self._push(self._outliers.setdefault(category, []), float(score), expense(index, float(score)))
+
+        thresholds = np.array([self.threshold_for(c) for c in store.categories])
+        large = np.flatnonzero(amounts >= thresholds[category_codes])
+        order = np.argsort(months[large], kind='stable')
+        large = large[order]
+        bounds = np.flatnonzero(np.diff(months[large])) + 1
+        for group in np.split(large, bounds):
+            if not len(group):
+                continue
+            period = period_of(days_to_date(dates[group[0]]))
+            for index, amount in zip(*top_indices(group, amounts[group])):
+                self._push(self._by_period.setdefault(period, []), float(amount), expense(index))
+
+    @staticmethod
+    def _sorted(heap, n):
+        items = [expense for _, _, expense in sorted(heap, reverse=True)]
+        return items[:n] if n is not None else items
+
+    def top(self, n=None, category=None, period=None):
+        """达到阈值的消费中金额最高的（最多 k 笔），可限定分类或月份（"2024-03"），降序"""
+        if category is not None and period is not None:
+            raise ValueError("category 和 period 只能指定一个")
+        if category is not None:
+            heap = self._by_category.get(category, [])
+        elif period is not None:
+            heap = self._by_period.get(period, [])
+        else:
+            heap = self._top
+        return self._sorted(heap, n)
+
+    def outliers(self, category=None, n=None):
+        """异常消费，按稳健 z 分数降序；不指定分类时合并所有分类"""
+        if category is not None:
+            return self._sorted(self._outliers.get(category, []), n)
+        items = [item for heap in self._outliers.values() for item in heap]
+        return self._sorted(items, n)
+
+    def categories(self):
+        return list(self._by_category)
+
+    def periods(self):
+        return sorted(self._by_period)
@@ -0,0 +1,99 @@
+import atexit
+import threading
+
+# 默认超时（秒）与每个接口地址同时进行的请求数上限
+DEFAULT_TIMEOUT = 120.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_MAX_CONCURRENCY = 8
+
+_default_manager = None
+_default_lock = threading.Lock()
+
+class ClientManager:
+    """按 (base_url, api_key) 复用 OpenAI 客户端
+
+    同一接口的多次运行共用一个客户端及其 HTTP 连接池，保持长连接，省去重复的 TCP/TLS 握手；
+    每个客户端附带一个信号量，限制同时进行的请求数（包括多个任务并发时的合计）。
+    客户端自身不重试（max_retries=0），重试和退避由 请求调度.RequestScheduler 统一处理。
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_concurrency = max_concurrency
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._limits = {}
+        self.created = 0
+
+    def _make_timeout(self):
+        from openai import Timeout
+        return Timeout(self.timeout, connect=self.connect_timeout)
+
+    def get(self, base_url, api_key):
+        """取得（必要时创建）该接口的客户端；openai 在第一次调用时才导入"""
+        key = (base_url, api_key)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    from openai import OpenAI
+                    client = OpenAI(api_key=api_key, base_url=base_url, timeout=self._make_timeout(),
+                                    max_retries=0)
+                    self._clients[key] = client
+                    self.created += 1
+        return client
+
+    def limit(self, base_url, api_key):
+        """该接口的并发信号量，请求期间以 with 持有"""
+        key = (base_url, api_key)
+        with self._lock:
+            semaphore = self._limits.get(key)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(max(1, self.max_concurrency))
+                self._limits[key] = semaphore
+        return semaphore
+
+    def configure(self, timeout=None, connect_timeout=None, max_concurrency=None):
+        """修改超时和并发上限
+
+        已有客户端通过 with_options 换用新超时，仍共用原来的连接池；新的并发上限对之后取得的信号量生效。
+        """
+        with self._lock:
+            timeout_changed = (timeout is not None and timeout != self.timeout) or \
+                (connect_timeout is not None and connect_timeout != self.connect_timeout)
+            if timeout is not None:
+                self.timeout = timeout
+            if connect_timeout is not None:
+                self.connect_timeout = connect_timeout
+            if timeout_changed and self._clients:
+                new_timeout = self._make_timeout()
+                self._clients = {key: client.with_options(timeout=new_timeout)
+                                 for key, client in self._clients.items()}
+            if max_concurrency is not None and max_concurrency != self.max_concurrency:
+                self.max_concurrency = max_concurrency
+                self._limits.clear()
+
+    def close(self):
+        """关闭全部客户端的连接"""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            self._limits.clear()
+        for client in clients:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+def get_client_manager():
+    """进程内共享的客户端管理器，界面和命令行的所有任务共用"""
+    global _default_manager
+    if _default_manager is None:
+        with _default_lock:
+            if _default_manager is None:
+                _default_manager = ClientManager()
+                atexit.register(_default_manager.close)
+    return _default_manager
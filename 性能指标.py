@@ -0,0 +1,75 @@
+from contextlib import contextmanager
+import datetime
+import json
+import threading
+import time
+import uuid
+
+class MetricsRecorder:
+    """记录各处理阶段的耗时和计数，每条指标追加一行 JSON 到 metrics.jsonl
+
+    span 记录一段代码的耗时，可在 with 块中往返回的字典里补充记录数、token 数等字段；
+    有 records 字段时自动计算每秒处理条数。path 为 None 时只保存在内存中。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.run_id = uuid.uuid4().hex[:12]
+        self.entries = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage, **fields):
+        start = time.perf_counter()
+        error = None
+        try:
+            yield fields
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            if error:
+                fields['error'] = error
+            self.record(stage, seconds=seconds, **fields)
+
+    def record(self, stage, seconds=None, **fields):
+        """写入一条指标"""
+        entry = {'ts': datetime.datetime.now().isoformat(timespec='milliseconds'),
+                 'run_id': self.run_id, 'stage': stage}
+        if seconds is not None:
+            entry['seconds'] = round(seconds, 6)
+            if fields.get('records') and seconds > 0:
+                entry['records_per_second'] = round(fields['records'] / seconds, 1)
+        entry.update(fields)
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self.entries.append(entry)
+            if self.path:
+                try:
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write(line + '\n')
+                except OSError:
+                    pass
+        return entry
+
+    def summary(self):
+        """按阶段汇总：[(阶段, 次数, 总耗时, 记录数, 每秒条数)]，按首次出现的顺序"""
+        rows = {}
+        with self._lock:
+            entries = list(self.entries)
+        for entry in entries:
+            row = rows.setdefault(entry['stage'], [entry['stage'], 0, 0.0, 0])
+            row[1] += 1
+            row[2] += entry.get('seconds') or 0.0
+            row[3] += entry.get('records') or 0
+        return [(stage, count, seconds, records, records / seconds if records and seconds else None)
+                for stage, count, seconds, records in rows.values()]
+
+    def format_summary(self):
+        """汇总表的文本形式，用于日志"""
+        lines = [f"{'阶段':<24}{'次数':>6}{'耗时(秒)':>12}{'记录数':>10}{'条/秒':>12}"]
+        for stage, count, seconds, records, rate in self.summary():
+            lines.append(f"{stage:<26}{count:>6}{seconds:>14.3f}{records or '':>12}"
+                         f"{(f'{rate:,.0f}' if rate else ''):>14}")
+        return "\n".join(lines)
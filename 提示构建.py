@@ -0,0 +1,117 @@
+import math
+import re
+
+from 本地分类 import parse_category_rules
+
+# 本地估算 token 数：中日韩字符约 0.6 个 token，其余字符约 4 个一个 token
+CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+# 每条输出记录预计的 token 数（标准格式 / 紧凑格式）
+OUTPUT_TOKENS_PER_RECORD = 32
+COMPACT_TOKENS_PER_RECORD = 16
+OUTPUT_TOKENS_OVERHEAD = 64
+MIN_MAX_TOKENS = 256
+
+COMPACT_TEMPLATE = """将下列消费记录逐条转换，每条输出一行，字段用制表符分隔：
+日期(年-月-日)\t类别编号\t名称\t金额(两位小数)
+只在 # start 与 # end 之间输出结果。
+类别编号：
+{categories}
+{notes}示例：
+# start
+2024-01-01\t1\t咖啡\t32.00
+# end
+记录：
+{records}
+"""
+
+def estimate_tokens(text):
+    """粗略估算文本的 token 数，只用于打包预算，不需要精确"""
+    cjk = len(CJK_PATTERN.findall(text))
+    return math.ceil(cjk * 0.6 + (len(text) - cjk) / 4)
+
+class PromptBuilder:
+    """按 token 预算把记录打包成多次请求，并生成对应的 prompt
+
+    compact 为 True 时使用类别编号和制表符分隔的紧凑输出格式，减少输出 token，
+    分类标准中不属于类别规则的说明文字附在类别编号之后；提取不到类别时自动退回标准格式。
+    """
+
+    def __init__(self, categories, standard_builder, input_budget=6000, output_budget=4000, compact=False):
+        self.categories = categories
+        self.standard_builder = standard_builder
+        self.input_budget = input_budget
+        self.output_budget = output_budget
+
+        notes = []
+        rules = parse_category_rules(categories, notes)
+        self.category_notes = "".join(f"{note}\n" for note in notes)
+        if self.category_notes:
+            self.category_notes = "分类说明：\n" + self.category_notes
+        self.category_names = list(dict.fromkeys(rules.values()))
+        self.compact = compact and bool(self.category_names)
+        if self.compact:
+            keywords = {name: [] for name in self.category_names}
+            for keyword, category in rules.items():
+                if keyword != category:
+                    keywords[category].append(keyword)
+            self.category_table = "\n".join(
+                f"{code}={name}" + (f"（{'、'.join(keywords[name])}）" if keywords[name] else "")
+                for code, name in enumerate(self.category_names, 1)
+            )
+        self.overhead_tokens = estimate_tokens(self.build([]))
+
+    def build(self, chunk):
+        """生成一个分块的 prompt"""
+        records = "\n".join(chunk)
+        if self.compact:
+            return COMPACT_TEMPLATE.format(categories=self.category_table, notes=self.category_notes,
+                                           records=records)
+        return self.standard_builder(self.categories, records)
+
+    def max_tokens_for(self, chunk):
+        """根据记录条数推算 max_tokens，不超过输出预算"""
+        per_record = COMPACT_TOKENS_PER_RECORD if self.compact else OUTPUT_TOKENS_PER_RECORD
+        expected = OUTPUT_TOKENS_OVERHEAD + len(chunk) * per_record
+        return max(MIN_MAX_TOKENS, min(self.output_budget, math.ceil(expected * 1.3)))
+
+    def pack(self, records, max_records=0):
+        """按输入/输出预算（以及可选的条数上限）把记录分成若干块，保持原顺序"""
+        per_record = COMPACT_TOKENS_PER_RECORD if self.compact else OUTPUT_TOKENS_PER_RECORD
+        chunks = []
+        current = []
+        input_tokens = self.overhead_tokens
+        for line in records:
+            line_tokens = estimate_tokens(line) + 1
+            over_input = input_tokens + line_tokens > self.input_budget
+            over_output = (OUTPUT_TOKENS_OVERHEAD + (len(current) + 1) * per_record) * 1.3 > self.output_budget
+            over_count = max_records and len(current) >= max_records
+            if current and (over_input or over_output or over_count):
+                chunks.append(current)
+                current = []
+                input_tokens = self.overhead_tokens
+            current.append(line)
+            input_tokens += line_tokens
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def decode(self, line):
+        """把模型输出的一行转为 DATE/TYPE/NAME/COST 格式，标准格式的行原样返回
+
+        紧凑格式下字段数不对、类别编号不是数字或超出范围时返回 None。
+        """
+        if not self.compact or line.startswith('DATE:'):
+            return line
+        fields = [field.strip() for field in line.split('\t')]
+        if len(fields) != 4:
+            return None
+        date, code, name, amount = fields
+        try:
+            index = int(code) - 1
+        except ValueError:
+            return None
+        if not 0 <= index < len(self.category_names):
+            return None
+        category = self.category_names[index]
+        return f"DATE:{date} TYPE:{category} NAME:{name} COST:{amount}"
@@ -0,0 +1,211 @@
+from collections import Counter, deque
+import datetime
+import re
+
+from 记录解析 import iter_records
+
+# 分类标准中 “类别: 关键词、关键词” 形式的行
+RULE_PATTERN = re.compile(r'^\s*(?:[-*+]\s*)?([^:：#]+?)\s*[:：]\s*(.+)$')
+KEYWORD_SEPARATORS = re.compile(r'[、,，/;；|\s]+')
+# 含这些词的标题或冒号前的文字是文档标题、说明（如“# 分类标准”“注意：报销的不算”），不是类别
+GENERIC_WORDS = ('分类', '类别', '标准', '说明', '规则', '注意', '备注', '提示', '示例', '例如', '要求', '格式')
+SENTENCE_PUNCTUATION = re.compile(r'[。！？!?]')
+MAX_CATEGORY_LENGTH = 10
+
+DATE_PATTERNS = [
+    re.compile(r'(\d{4})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})\s*[日号]?'),
+    re.compile(r'(?<!\d)()(\d{1,2})\s*月\s*(\d{1,2})\s*[日号]?'),
+    re.compile(r'(?<![\d.])()(\d{1,2})/(\d{1,2})(?![\d/])'),
+]
+RELATIVE_DAYS = {'今天': 0, '今日': 0, '昨天': 1, '昨日': 1, '前天': 2}
+AMOUNT_PATTERN = re.compile(r'(?<![\d.])(\d+(?:\.\d{1,2})?)\s*(?:元|块钱|块|rmb|RMB)?(?![\d.])')
+NAME_STRIP = re.compile(r'[\s，,。.、:：;；!！?？()（）]+')
+# 用剩余文字作名称时去掉的陪同人、动词和“花了”等修饰
+NAME_PREFIX = re.compile(r'^(?:(?:和|跟|与)(?:朋友|同事|家人|同学)们?)?(?:一起)?(?:去|买了?|吃了?|喝了?|付了?|交了?|充了?)?')
+NAME_SUFFIX = re.compile(r'(?:花了|花费|用了|一共|共计|共)$')
+
+class AhoCorasick:
+    """Aho-Corasick 多模式匹配，一次扫描找出文本中出现的全部关键词"""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+    def add(self, word, value):
+        node = 0
+        for char in word:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append((len(word), value))
+
+    def build(self):
+        """添加完全部关键词后计算失败指针"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                if self._fail[child] == child:
+                    self._fail[child] = 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find(self, text):
+        """产出 (起始位置, 长度, value)"""
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for length, value in self._output[node]:
+                yield index - length + 1, length, value
+
+def is_category_name(text):
+    """text 是否像一个类别名：较短、不含说明性的词和句子标点"""
+    return (0 < len(text) <= MAX_CATEGORY_LENGTH and not SENTENCE_PUNCTUATION.search(text)
+            and not any(word in text for word in GENERIC_WORDS))
+
+def parse_category_rules(text, notes=None):
+    """从分类标准中提取 {关键词: 类别}
+
+    支持 “类别: 关键词、关键词” 行，以及类别标题（# 餐饮）下以 - 开头逐行列出的关键词；
+    “# 分类标准” 这类通用标题下（或没有标题时）不带冒号的列表项本身是类别名。
+    类别名本身也作为关键词。冒号前不像类别名或关键词含句子标点的行（如“注意：报销的不算”）视为说明文字；
+    传入 notes 列表时收集这些不属于规则的说明文字行。
+    """
+    rules = {}
+    current = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('```') or line.startswith('//'):
+            continue
+        if line.startswith('#'):
+            heading = line.lstrip('#').strip()
+            current = heading if is_category_name(heading) else None
+            if current:
+                rules.setdefault(current, current)
+            continue
+        match = RULE_PATTERN.match(line)
+        item = line.lstrip('-*+ ') if line[0] in '-*+' else None
+        if match and is_category_name(match.group(1).strip()) and not SENTENCE_PUNCTUATION.search(match.group(2)):
+            category, keywords = match.group(1).strip(), match.group(2)
+            rules.setdefault(category, category)
+        elif item and current:
+            category, keywords = current, item
+        elif item and is_category_name(item):
+            rules.setdefault(item, item)
+            continue
+        else:
+            if notes is not None:
+                notes.append(line)
+            continue
+        for keyword in KEYWORD_SEPARATORS.split(keywords):
+            if keyword:
+                rules.setdefault(keyword, category)
+    return rules
+
+def learn_from_config(config_file):
+    """从以往的 config.txt 学习 {名称: 类别}，同一名称取出现最多的类别"""
+    votes = {}
+    try:
+        for record in iter_records(config_file):
+            votes.setdefault(record.name, Counter())[record.category] += 1
+    except OSError:
+        return {}
+    return {name: counter.most_common(1)[0][0] for name, counter in votes.items()}
+
+def extract_date(text, today):
+    """找出文本中的日期，返回 (日期, 去掉日期后的文本)；没有或日期无效时日期为 None
+
+    没写年份时按 today 的年份，日期在 today 之后则按去年处理（如一月份补记十二月的账）。
+    """
+    for pattern in DATE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            year, month, day = match.groups()
+            try:
+                date = datetime.date(int(year) if year else today.year, int(month), int(day))
+                if not year and date > today:
+                    date = date.replace(year=date.year - 1)
+            except ValueError:
+                return None, text
+            return date, text[:match.start()] + ' ' + text[match.end():]
+    for word, offset in RELATIVE_DAYS.items():
+        if word in text:
+            return today - datetime.timedelta(days=offset), text.replace(word, ' ')
+    return None, text
+
+def extract_amount(text):
+    """找出文本中唯一的金额，返回 (金额, 去掉金额后的文本)；没有或有多个金额时金额为 None"""
+    amounts = AMOUNT_PATTERN.findall(text)
+    if len(amounts) != 1:
+        return None, text
+    return float(amounts[0]), AMOUNT_PATTERN.sub(' ', text)
+
+def clean_name(text):
+    """去掉标点、陪同人、动词等修饰后的剩余文字，如“和朋友去 京东 花了” -> “京东”"""
+    text = NAME_STRIP.sub('', text)
+    return NAME_SUFFIX.sub('', NAME_PREFIX.sub('', text))
+
+class LocalClassifier:
+    """本地规则分类：关键词匹配类别，本地解析日期和金额
+
+    只有日期、金额都唯一且匹配到的关键词都指向同一类别时才给出结果，否则返回 None 交给 AI。
+    """
+
+    def __init__(self, rules, today=None):
+        self.today = today or datetime.date.today()
+        self.keyword_count = len(rules)
+        self._matcher = AhoCorasick()
+        for keyword, category in rules.items():
+            self._matcher.add(keyword, (keyword, category))
+        self._matcher.build()
+
+    @classmethod
+    def from_sources(cls, categories_text, config_files=(), today=None):
+        """分类标准中的规则优先，其次是从以往结果学到的名称（只保留分类标准中有的类别）
+
+        分类标准中提取不到任何规则时返回 None。
+        """
+        category_rules = parse_category_rules(categories_text)
+        if not category_rules:
+            return None
+        known = set(category_rules.values())
+        rules = {}
+        for config_file in config_files:
+            rules.update((name, category) for name, category in learn_from_config(config_file).items()
+                         if category in known)
+        rules.update(category_rules)
+        return cls(rules, today)
+
+    def classify(self, line):
+        """识别一行记账内容，成功时返回 DATE/TYPE/NAME/COST 格式的记录行"""
+        date, rest = extract_date(line, self.today)
+        if date is None:
+            return None
+        amount, rest = extract_amount(rest)
+        if amount is None:
+            return None
+
+        matches = list(self._matcher.find(rest))
+        categories = {category for _, _, (_, category) in matches}
+        if len(categories) != 1:
+            return None
+        category = categories.pop()
+        # 名称取匹配到的最长关键词（类别名本身除外），与 AI 给出的简短名称一致；只匹配到类别名时才用剩余文字
+        keywords = [keyword for _, _, (keyword, _) in matches if keyword != category]
+        if keywords:
+            name = max(keywords, key=len)
+        else:
+            name = clean_name(rest.replace(category, ' ')) or category
+        return f"DATE:{date.isoformat()} TYPE:{category} NAME:{name} COST:{amount:.2f}"
@@ -0,0 +1,79 @@
+from collections import namedtuple
+from functools import lru_cache
+import datetime
+import mmap
+import os
+import re
+
+# 一条记录：DATE:年-月-日 TYPE:类别 NAME:具体内容 COST:金额 [描述]
+# NAME 可以包含空格和冒号，匹配到最后一个 COST 为止；COST 之后空格分隔的内容为描述
+RECORD_PATTERN = re.compile(
+    rb'^DATE:\s*(\d{4})-(\d{1,2})-(\d{1,2})\s+TYPE:\s*(.+?)\s+NAME:\s*(.*)\s+COST:\s*(-?\d+(?:\.\d+)?)'
+    rb'\s*(?:\xe5\x85\x83)?(?:\s+(.*?))?\s*$'
+)
+
+# 超过该大小的文件默认使用 mmap 读取
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+Record = namedtuple('Record', ['line_no', 'date', 'category', 'name', 'amount', 'description'], defaults=('',))
+RejectedLine = namedtuple('RejectedLine', ['line_no', 'line', 'reason'])
+
+@lru_cache(maxsize=4096)
+def _make_date(year, month, day):
+    return datetime.date(int(year), int(month), int(day))
+
+def _parse(raw, line_no):
+    """解析一行（bytes），成功返回 Record，否则返回失败原因字符串"""
+    match = RECORD_PATTERN.match(raw)
+    if match is None:
+        return "格式不符合 DATE/TYPE/NAME/COST"
+    year, month, day, category, name, amount, description = match.groups()
+    try:
+        date = _make_date(year, month, day)
+    except ValueError:
+        return "日期无效"
+    try:
+        return Record(line_no, date, category.decode('utf-8'), name.decode('utf-8'), float(amount),
+                      description.decode('utf-8') if description else '')
+    except UnicodeDecodeError:
+        return "不是有效的 UTF-8 文本"
+
+def parse_line(line, line_no=0):
+    """解析单行文本，成功返回 Record，格式不符时返回 None"""
+    record = _parse(line.strip().encode('utf-8'), line_no)
+    return record if isinstance(record, Record) else None
+
+def _iter_lines(f, use_mmap):
+    if use_mmap:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from iter(mm.readline, b'')
+    else:
+        yield from f
+
+def iter_records(file_path, errors=None, use_mmap=None):
+    """逐行读取 config.txt，产出 # start 与 # end 之间的 Record
+
+    无法解析的行不会中断读取；传入 errors 列表时以 RejectedLine 记录行号和原因。
+    use_mmap 为 None 时按文件大小自动选择。读取失败时抛出 OSError。
+    """
+    with open(file_path, 'rb') as f:
+        if use_mmap is None:
+            use_mmap = os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD
+        if use_mmap and os.fstat(f.fileno()).st_size == 0:
+            return
+        is_reading = False
+        for line_no, raw in enumerate(_iter_lines(f, use_mmap), 1):
+            raw = raw.strip()
+            if raw == b'# start':
+                is_reading = True
+                continue
+            elif raw == b'# end':
+                break
+            if not is_reading or not raw:
+                continue
+
+            record = _parse(raw, line_no)
+            if isinstance(record, Record):
+                yield record
+            elif errors is not None:
+                errors.append(RejectedLine(line_no, raw.decode('utf-8', 'replace'), record))
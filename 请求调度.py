@@ -0,0 +1,149 @@
+import random
+import threading
+import time
+
+# 可重试的 HTTP 状态码：限流和服务端错误
+RETRYABLE_STATUS = {408, 409, 429}
+# 没有状态码、但属于网络层面的错误
+RETRYABLE_ERRORS = {'APIConnectionError', 'APITimeoutError', 'ConnectionError', 'TimeoutError'}
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+class AllModelsFailed(Exception):
+    """所有候选模型都不可用"""
+
+class TokenBucket:
+    """令牌桶限速：每秒补充 rate 个令牌，最多积累 capacity 个"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，不够时等待，返回等待的秒数"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+def status_code_of(error):
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+def is_retryable(error):
+    """429、5xx 和网络错误可以重试；其余错误（如 400、401）重试也不会成功"""
+    status = status_code_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+def retry_after(error):
+    """服务端通过 Retry-After 头给出的等待秒数，没有时返回 None"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+class RequestScheduler:
+    """包在每次接口调用外的调度器
+
+    - 每个接口地址一个令牌桶，限制每秒请求数（rate 为 0 时不限速）
+    - 429/5xx/网络错误按带抖动的指数退避重试，优先使用服务端的 Retry-After
+    - 同一模型重试用完仍失败时切换到下一个候选模型，并在 cooldown 秒内跳过该模型；
+      所有模型都在冷却中时每个模型只试一次，不再逐个退避重试
+    """
+
+    def __init__(self, rate=0, max_retries=4, base_delay=1.0, max_delay=30.0, cooldown=60.0):
+        self.rate = rate
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._unavailable = {}
+
+    def configure(self, rate=None, max_retries=None):
+        with self._lock:
+            if rate is not None and rate != self.rate:
+                self.rate = rate
+                self._buckets.clear()
+            if max_retries is not None:
+                self.max_retries = max_retries
+
+    def bucket(self, base_url):
+        if not self.rate:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(base_url)
+            if bucket is None:
+                bucket = self._buckets[base_url] = TokenBucket(self.rate)
+        return bucket
+
+    def backoff(self, attempt):
+        """第 attempt 次重试前的等待时间：full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def available_models(self, base_url, models):
+        """去掉冷却中的模型，全部都在冷却时返回空列表"""
+        now = time.monotonic()
+        with self._lock:
+            return [m for m in models if self._unavailable.get((base_url, m), 0) <= now]
+
+    def call(self, base_url, models, request, log=None):
+        """依次用候选模型调用 request(model)，返回 (结果, 实际使用的模型)
+
+        不可重试的错误直接抛出；所有模型都失败时抛出 AllModelsFailed。
+        """
+        log = log or (lambda message: None)
+        bucket = self.bucket(base_url)
+        last_error = None
+        available = self.available_models(base_url, models)
+        retries = self.max_retries if available else 0
+        for model in available or models:
+            for attempt in range(retries + 1):
+                if bucket is not None:
+                    bucket.acquire()
+                try:
+                    return request(model), model
+                except Exception as e:
+                    if not is_retryable(e):
+                        raise
+                    last_error = e
+                    if attempt == retries:
+                        break
+                    delay = retry_after(e)
+                    delay = min(self.max_delay, delay) if delay is not None else self.backoff(attempt)
+                    log(f"{model} 请求失败（{status_code_of(e) or type(e).__name__}），{delay:.1f} 秒后重试")
+                    time.sleep(delay)
+            with self._lock:
+                self._unavailable[(base_url, model)] = time.monotonic() + self.cooldown
+            if len(models) > 1:
+                log(f"模型 {model} 暂时不可用，切换到下一个模型")
+        raise AllModelsFailed(f"所有模型均不可用: {last_error}") from last_error
+
+def get_request_scheduler():
+    """进程内共享的调度器，同一接口地址的限速在所有任务间共用"""
+    global _default_scheduler
+    if _default_scheduler is None:
+        with _default_lock:
+            if _default_scheduler is None:
+                _default_scheduler = RequestScheduler()
+    return _default_scheduler
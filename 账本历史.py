@@ -0,0 +1,278 @@
+import datetime
+import hashlib
+import sqlite3
+import threading
+
+class LedgerHistory:
+    """跨月份累积的账本历史（SQLite）
+
+    records 表按来源（记账文件）、日期和来源记录的指纹保存每条结果，按 (date, category) 建索引；
+    同一来源再次导入时，在同一事务中删除该来源在本次结果日期范围内的旧记录并从汇总中减去，再写入新结果，
+    因此修改或删除的记录不会重复计入，而同一记账文件每月清空重写时，之前月份的记录仍然保留。
+    daily_rollup 表保存按日、按分类的汇总，在写入记录时同步增量更新，
+    所有时间段查询都只读汇总表，不再扫描原始记录。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._migrate()
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TEXT NOT NULL,
+                source TEXT,
+                inserted INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT,
+                fingerprint TEXT NOT NULL,
+                date TEXT NOT NULL,
+                category TEXT NOT NULL,
+                name TEXT NOT NULL,
+                amount REAL NOT NULL,
+                run_id INTEGER NOT NULL
+            );
+            DROP INDEX IF EXISTS idx_records_source_fingerprint;
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_records_source_date_fingerprint ON records(source, date, fingerprint);
+            CREATE INDEX IF NOT EXISTS idx_records_date_category ON records(date, category);
+            CREATE INDEX IF NOT EXISTS idx_records_category_date ON records(category, date);
+            CREATE TABLE IF NOT EXISTS daily_rollup (
+                date TEXT NOT NULL,
+                category TEXT NOT NULL,
+                total REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (date, category)
+            );
+        """)
+        self._conn.commit()
+
+    def _migrate(self):
+        """旧版本的 records 表没有 source 列：改为新表结构，原有记录作为来源不明（source 为 NULL）的历史保留"""
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(records)")]
+        if not columns or 'source' in columns:
+            return
+        self._conn.executescript("""
+            DROP INDEX IF EXISTS idx_records_date_category;
+            DROP INDEX IF EXISTS idx_records_category_date;
+            ALTER TABLE records RENAME TO records_old;
+            CREATE TABLE records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT,
+                fingerprint TEXT NOT NULL,
+                date TEXT NOT NULL,
+                category TEXT NOT NULL,
+                name TEXT NOT NULL,
+                amount REAL NOT NULL,
+                run_id INTEGER NOT NULL
+            );
+            INSERT INTO records (id, source, fingerprint, date, category, name, amount, run_id)
+                SELECT id, NULL, fingerprint, date, category, name, amount, run_id FROM records_old;
+            DROP TABLE records_old;
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def fingerprint_records(records):
+        """按记录内容（日期、分类、名称、金额）生成指纹，相同的记录按出现次序区分
+
+        调用方没有来源记录的指纹时使用。
+        """
+        seen = {}
+        fingerprints = []
+        for record in records:
+            key = f"{record.date.isoformat()}\0{record.category}\0{record.name}\0{record.amount:.2f}"
+            seen[key] = seen.get(key, 0) + 1
+            fingerprints.append(hashlib.sha1(f"{key}\0{seen[key]}".encode('utf-8')).hexdigest())
+        return fingerprints
+
+    def add_records(self, records, source, fingerprints=None):
+        """导入来源 source（记账文件）的全部 记录解析.Record，替换该来源上次导入、日期在本次结果范围内的记录
+
+        fingerprints 为每条结果对应的来源记录指纹，省略时按记录内容生成。
+        本次结果最早日期之前、最晚日期之后的旧记录（如同一文件之前月份的内容）保留。
+        旧版本导入、来源不明的记录中与本次结果完全相同的会被本次结果取代。
+        返回 (写入条数, 替换掉的旧记录条数)。
+        """
+        records = list(records)
+        if not records:
+            return 0, 0
+        if fingerprints is None:
+            fingerprints = self.fingerprint_records(records)
+        start, end = import_range(records)
+        with self._lock:
+            try:
+                cursor = self._conn.execute(
+                    "INSERT INTO runs (created_at, source) VALUES (?, ?)",
+                    (datetime.datetime.now().isoformat(timespec='seconds'), source)
+                )
+                run_id = cursor.lastrowid
+                removed = self._remove_source(source, start, end)
+                has_legacy = self._conn.execute(
+                    "SELECT 1 FROM records WHERE source IS NULL LIMIT 1").fetchone() is not None
+                inserted = 0
+                for fingerprint, record in zip(fingerprints, records):
+                    date = record.date.isoformat()
+                    if has_legacy:
+                        removed += self._claim_legacy(date, record)
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO records (source, fingerprint, date, category, name, amount, run_id) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (source, fingerprint, date, record.category, record.name, record.amount, run_id)
+                    )
+                    if cursor.rowcount != 1:
+                        continue
+                    inserted += 1
+                    self._conn.execute(
+                        "INSERT INTO daily_rollup (date, category, total, count) VALUES (?, ?, ?, 1) "
+                        "ON CONFLICT(date, category) DO UPDATE SET "
+                        "total = total + excluded.total, count = count + 1",
+                        (date, record.category, record.amount)
+                    )
+                self._conn.execute("UPDATE runs SET inserted = ? WHERE id = ?", (inserted, run_id))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return inserted, removed
+
+    def _subtract(self, date, category, total, count):
+        self._conn.execute(
+            "UPDATE daily_rollup SET total = total - ?, count = count - ? WHERE date = ? AND category = ?",
+            (total, count, date, category)
+        )
+        self._conn.execute("DELETE FROM daily_rollup WHERE date = ? AND category = ? AND count <= 0",
+                           (date, category))
+
+    def _remove_source(self, source, start, end):
+        """删除来源 source 在 [start, end] 内的记录并从汇总中减去，返回删除的条数"""
+        params = (source, start.isoformat(), end.isoformat())
+        rows = self._conn.execute(
+            "SELECT date, category, SUM(amount), COUNT(*) FROM records "
+            "WHERE source = ? AND date BETWEEN ? AND ? GROUP BY date, category",
+            params
+        ).fetchall()
+        for date, category, total, count in rows:
+            self._subtract(date, category, total, count)
+        self._conn.execute("DELETE FROM records WHERE source = ? AND date BETWEEN ? AND ?", params)
+        return sum(row[3] for row in rows)
+
+    def _claim_legacy(self, date, record):
+        """删除一条与 record 完全相同、来源不明的旧记录，返回删除的条数"""
+        row = self._conn.execute(
+            "SELECT id FROM records WHERE source IS NULL AND date = ? AND category = ? AND name = ? AND amount = ? "
+            "LIMIT 1",
+            (date, record.category, record.name, record.amount)
+        ).fetchone()
+        if row is None:
+            return 0
+        self._conn.execute("DELETE FROM records WHERE id = ?", row)
+        self._subtract(date, record.category, record.amount, 1)
+        return 1
+
+    def category_totals(self, start, end):
+        """[start, end] 日期范围内各分类的 {分类: (总金额, 笔数)}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT category, SUM(total), SUM(count) FROM daily_rollup "
+                "WHERE date BETWEEN ? AND ? GROUP BY category ORDER BY SUM(total) DESC",
+                (start.isoformat(), end.isoformat())
+            ).fetchall()
+        return {category: (total, count) for category, total, count in rows}
+
+    def daily_totals(self, start, end, category=None):
+        """[start, end] 内逐日的 (日期, 总金额)，可只看某一分类"""
+        sql = "SELECT date, SUM(total) FROM daily_rollup WHERE date BETWEEN ? AND ?"
+        params = [start.isoformat(), end.isoformat()]
+        if category is not None:
+            sql += " AND category = ?"
+            params.append(category)
+        with self._lock:
+            rows = self._conn.execute(sql + " GROUP BY date ORDER BY date", params).fetchall()
+        return [(datetime.date.fromisoformat(date), total) for date, total in rows]
+
+    def iter_records(self, start=None, end=None, exclude_source=None, exclude_range=None):
+        """按日期顺序产出历史中的 记录解析.Record（line_no 为 None），可限定日期范围、排除某个来源
+
+        exclude_range 为 (起, 止) 时只排除该来源在这段日期内的记录。
+        """
+        from 记录解析 import Record
+        conditions = []
+        params = []
+        if start is not None and end is not None:
+            conditions.append("date BETWEEN ? AND ?")
+            params += [start.isoformat(), end.isoformat()]
+        if exclude_source is not None and exclude_range is not None:
+            conditions.append("NOT (source IS ? AND date BETWEEN ? AND ?)")
+            params += [exclude_source, exclude_range[0].isoformat(), exclude_range[1].isoformat()]
+        elif exclude_source is not None:
+            conditions.append("source IS NOT ?")
+            params.append(exclude_source)
+        sql = "SELECT date, category, name, amount FROM records"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY date, id", params).fetchall()
+        for date, category, name, amount in rows:
+            yield Record(None, datetime.date.fromisoformat(date), category, name, amount)
+
+    def date_range(self):
+        """历史中最早和最晚的日期，没有记录时返回 (None, None)"""
+        with self._lock:
+            first, last = self._conn.execute("SELECT MIN(date), MAX(date) FROM daily_rollup").fetchone()
+        if first is None:
+            return None, None
+        return datetime.date.fromisoformat(first), datetime.date.fromisoformat(last)
+
+    def month_totals(self, year, month):
+        return self.category_totals(*month_range(year, month))
+
+    def quarter_totals(self, year, quarter):
+        return self.category_totals(*quarter_range(year, quarter))
+
+    def year_totals(self, year):
+        return self.category_totals(datetime.date(year, 1, 1), datetime.date(year, 12, 31))
+
+    def compare_months(self, year, month):
+        """与上个月按分类对比，返回 [(分类, 本月, 上月, 变化金额, 变化百分比或 None)]"""
+        previous_year, previous_month = (year, month - 1) if month > 1 else (year - 1, 12)
+        current = self.month_totals(year, month)
+        previous = self.month_totals(previous_year, previous_month)
+        rows = []
+        for category in list(current) + [c for c in previous if c not in current]:
+            now_total = current.get(category, (0.0, 0))[0]
+            before_total = previous.get(category, (0.0, 0))[0]
+            change = now_total - before_total
+            percent = change / before_total * 100 if before_total else None
+            rows.append((category, now_total, before_total, change, percent))
+        return rows
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def import_range(records):
+    """一次导入的记录覆盖的日期范围 (最早, 最晚)"""
+    dates = [record.date for record in records]
+    return min(dates), max(dates)
+
+def month_range(year, month):
+    start = datetime.date(year, month, 1)
+    if month == 12:
+        end = datetime.date(year, 12, 31)
+    else:
+        end = datetime.date(year, month + 1, 1) - datetime.timedelta(days=1)
+    return start, end
+
+def quarter_range(year, quarter):
+    start, _ = month_range(year, quarter * 3 - 2)
+    _, end = month_range(year, quarter * 3)
+    return start, end
+
+def period_label(first, last):
+    """图表标题用的时间段名称：同一月份显示“2024年01月”，否则显示起止日期"""
+    if first.year == last.year and first.month == last.month:
+        return f"{first.year}年{first.month:02d}月"
+    return f"{first.isoformat()} 至 {last.isoformat()}"
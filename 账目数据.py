@@ -0,0 +1,210 @@
+from array import array
+import datetime
+import json
+import os
+import shutil
+
+import numpy as np
+
+EPOCH = datetime.date(1970, 1, 1).toordinal()
+
+# 列式存储目录中的文件
+COLUMN_FILES = ('dates', 'category_codes', 'name_codes', 'amounts', 'description_codes')
+META_FILE = 'meta.json'
+FORMAT_VERSION = 2
+
+def columns_path(config_file):
+    """config.txt 对应的列式存储目录：config.cols"""
+    return os.path.splitext(config_file)[0] + '.cols'
+
+def file_signature(file_path):
+    """文件的大小和修改时间，用于判断列式存储是否过期"""
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def date_to_days(date):
+    """把 datetime.date 转为自 1970-01-01 起的天数"""
+    return date.toordinal() - EPOCH
+
+def days_to_date(days):
+    return datetime.date.fromordinal(int(days) + EPOCH)
+
+class RecordStore:
+    """按列存储的消费记录：日期、分类、名称、金额、描述
+
+    日期存为天数，分类、名称和描述存为字符串表中的编号（按首次出现的顺序编号），
+    追加时写入 array，聚合时一次性转为 NumPy 数组并缓存。
+    """
+
+    def __init__(self):
+        self.categories = []
+        self.names = []
+        self.descriptions = []
+        self._category_codes = {}
+        self._name_codes = {}
+        self._description_codes = {}
+        self._dates = array('i')
+        self._category_column = array('i')
+        self._name_column = array('i')
+        self._amounts = array('d')
+        self._description_column = array('i')
+        self._columns = None
+        self._mapped = False
+
+    def __len__(self):
+        if self._mapped:
+            return len(self._columns[3])
+        return len(self._amounts)
+
+    def _intern(self, value, table, codes):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(table)
+            table.append(value)
+        return code
+
+    @classmethod
+    def from_records(cls, records):
+        """由 记录解析.Record 序列构建"""
+        store = cls()
+        for record in records:
+            store.append(record.date, record.category, record.name, record.amount, record.description)
+        return store
+
+    def _unmap(self):
+        """从内存映射加载的数据在追加前复制到可写的 array 中"""
+        dates, category_codes, name_codes, amounts, description_codes = self._columns
+        self._dates = array('i', dates.astype(np.int32).tobytes())
+        self._category_column = array('i', category_codes.astype(np.int32).tobytes())
+        self._name_column = array('i', name_codes.astype(np.int32).tobytes())
+        self._amounts = array('d', amounts.astype(np.float64).tobytes())
+        self._description_column = array('i', description_codes.astype(np.int32).tobytes())
+        self._mapped = False
+
+    def append(self, date, category, name, amount, description=''):
+        """追加一条记录，date 为 datetime.date"""
+        if self._mapped:
+            self._unmap()
+        self._dates.append(date.toordinal() - EPOCH)
+        self._category_column.append(self._intern(category, self.categories, self._category_codes))
+        self._name_column.append(self._intern(name, self.names, self._name_codes))
+        self._amounts.append(amount)
+        self._description_column.append(self._intern(description or '', self.descriptions, self._description_codes))
+        self._columns = None
+
+    def _all_columns(self):
+        if self._columns is None:
+            self._columns = (
+                np.frombuffer(self._dates, dtype=np.int32).copy(),
+                np.frombuffer(self._category_column, dtype=np.int32).copy(),
+                np.frombuffer(self._name_column, dtype=np.int32).copy(),
+                np.frombuffer(self._amounts, dtype=np.float64).copy(),
+                np.frombuffer(self._description_column, dtype=np.int32).copy(),
+            )
+        return self._columns
+
+    def columns(self):
+        """返回 (dates, category_codes, name_codes, amounts) 四个 NumPy 数组"""
+        return self._all_columns()[:4]
+
+    def description(self, index):
+        """第 index 条记录的描述，没有描述时为空字符串"""
+        return self.descriptions[self._all_columns()[4][index]]
+
+    def record(self, index):
+        """返回第 index 条记录 (date, category, name, amount)"""
+        dates, category_codes, name_codes, amounts = self.columns()
+        return (days_to_date(dates[index]), self.categories[category_codes[index]],
+                self.names[name_codes[index]], float(amounts[index]))
+
+    def category_totals(self):
+        """各分类的 (总金额, 笔数)，按分类编号排列"""
+        _, category_codes, _, amounts = self.columns()
+        size = len(self.categories)
+        totals = np.bincount(category_codes, weights=amounts, minlength=size)
+        counts = np.bincount(category_codes, minlength=size)
+        return totals, counts
+
+    def category_summary(self, threshold=3.0):
+        """返回 (分类名列表, 金额数组, 总金额)
+
+        占比低于 threshold（百分比）的分类合并为“其他”。
+        """
+        totals, counts = self.category_totals()
+        present = counts > 0
+        labels = np.array(self.categories, dtype=object)[present]
+        totals = totals[present]
+        total = float(totals.sum())
+        if total <= 0:
+            return list(labels), totals, total
+        small = totals / total * 100 < threshold
+        if small.any():
+            labels = list(labels[~small]) + ['其他']
+            totals = np.append(totals[~small], totals[small].sum())
+        else:
+            labels = list(labels)
+        return labels, totals, total
+
+    def save(self, path, source_signature=None):
+        """保存为列式存储目录：每列一个 .npy 文件，字符串表写入 meta.json
+
+        先写入临时目录再替换，source_signature 记录生成时 config.txt 的状态。
+        """
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for file_name, column in zip(COLUMN_FILES, self._all_columns()):
+            np.save(os.path.join(tmp_path, file_name + '.npy'), column)
+        meta = {
+            'version': FORMAT_VERSION,
+            'count': len(self),
+            'categories': self.categories,
+            'names': self.names,
+            'descriptions': self.descriptions,
+            'source': source_signature,
+        }
+        with open(os.path.join(tmp_path, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, source_signature=None, mmap=True):
+        """读取列式存储目录；格式不符或与 source_signature 不一致时返回 None
+
+        mmap 为 True 时各列以只读内存映射方式打开，不需要逐行解析。
+        """
+        meta_file = os.path.join(path, META_FILE)
+        if not os.path.exists(meta_file):
+            return None
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != FORMAT_VERSION:
+            return None
+        if source_signature is not None and meta.get('source') != source_signature:
+            return None
+
+        store = cls()
+        store.categories = meta['categories']
+        store.names = meta['names']
+        store.descriptions = meta['descriptions']
+        store._category_codes = {value: code for code, value in enumerate(store.categories)}
+        store._name_codes = {value: code for code, value in enumerate(store.names)}
+        store._description_codes = {value: code for code, value in enumerate(store.descriptions)}
+        mmap_mode = 'r' if mmap else None
+        store._columns = tuple(
+            np.load(os.path.join(path, file_name + '.npy'), mmap_mode=mmap_mode)
+            for file_name in COLUMN_FILES
+        )
+        store._mapped = True
+        return store
+
+    def group_by_category(self):
+        """按分类编号分组，依次产出 (分类编号, 该分类的记录下标数组)，组内保持原顺序"""
+        _, category_codes, _, _ = self.columns()
+        order = np.argsort(category_codes, kind='stable')
+        bounds = np.searchsorted(category_codes[order], np.arange(len(self.categories) + 1))
+        for code in range(len(self.categories)):
+            indices = order[bounds[code]:bounds[code + 1]]
+            if len(indices):
+                yield code, indices